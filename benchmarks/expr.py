@@ -0,0 +1,43 @@
+'''Per-evaluation cost of an expression, before and after compilation.
+
+Run from the root of the project, `PYTHONPATH=. python benchmarks/expr.py`.'''
+import timeit
+from logo.compiler.lexer import Lexer
+from logo.compiler.expr import ExprParser
+from logo.compiler.codegen import Context
+
+VARIABLES = [':CORNERS', ':SIDE']
+
+EXPRESSIONS = [
+    '(360 / :CORNERS)',
+    '(360 / 6) * 2 + :SIDE',
+    'SQRT(:SIDE * :SIDE + 2 ^ 10) - MAX(:SIDE, 4) % 7',
+    '(1 + 2) * (3 + 4) - SQRT(81) / 3',
+]
+
+def parse(expr, fold):
+    lexer = Lexer()
+    lexer.tokenize(expr)
+    expr = ExprParser(lexer, fold=fold).parse()
+    expr.locate([VARIABLES])
+    return expr
+
+def measure(function, number):
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+if __name__ == '__main__':
+    scope = Context()
+    scope.enter([6.0, 100.0])
+    number = 100000
+
+    print '{:<52} {:>12} {:>12} {:>8}'.format(
+        'expression', 'before (ns)', 'after (ns)', 'speedup')
+    for expr in EXPRESSIONS:
+        walked = parse(expr, fold=False)
+        compiled = parse(expr, fold=True)
+        assert walked.interpret(scope) == compiled.evaluate(scope)
+
+        before = measure(lambda: walked.interpret(scope), number)
+        after = measure(lambda: compiled.evaluate(scope), number)
+        print '{:<52} {:>12.0f} {:>12.0f} {:>7.1f}x'.format(
+            expr, before * 1e9, after * 1e9, before / after)
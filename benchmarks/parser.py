@@ -0,0 +1,82 @@
+'''Parser throughput on a synthetic program of about 100k lines, against
+the parser before its keyword, operator and proc tables were hashed.
+
+Run from the root of the project, `PYTHONPATH=. python benchmarks/parser.py`.
+The options are
+    --lines N            size of the program, 100000 by default
+    --baseline FILE      the run to compare with, benchmarks/parser.json
+                         by default
+    --save               writes the run to the baseline instead
+
+The program is the library of benchmarks/programs.py, parsed one top
+level entry at a time into the same Ast, the way the REPL feeds it, so
+every Call looks up a large proc table. benchmarks/parser.json was
+measured on the parser of the commit before the tables were hashed,
+with PYTHONPATH pointing to a checkout of it, so save one of your own
+on your machine before comparing.'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from logo.compiler.parser import Parser, Ast
+import programs
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'parser.json')
+
+def generate(lines):
+    'Yields the entries of a library of procs of about lines lines.'
+    count = 0
+    entries = programs.entries(lines)
+    while count < lines:
+        for entry in (next(entries), next(entries)): # a proc and its calls
+            count += entry.count('\n') + 1
+            yield entry
+
+def measure(lines):
+    entries = list(generate(lines))
+    ast = Ast()
+    start = time.time()
+    for entry in entries:
+        Parser().parse(ast, entry)
+    elapsed = time.time() - start
+    return {'lines': sum(entry.count('\n') + 1 for entry in entries),
+        'entries': len(entries), 'seconds': elapsed,
+        'python': platform.python_version(), 'machine': platform.machine()}
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/parser.py',
+        description='Benchmarks the LOGO parser against a baseline.')
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true')
+    options = parser.parse_args(arguments)
+
+    result = measure(options.lines)
+    print '{:<10} {} lines, {} entries, parsed in {:.2f}s, {:.0f} lines/s'.\
+        format('now', result['lines'], result['entries'], result['seconds'],
+        result['lines'] / result['seconds'])
+    if options.save:
+        with open(options.baseline, 'w') as output:
+            json.dump(result, output, indent=2)
+        return 0
+
+    with open(options.baseline, 'r') as baseline:
+        baseline = json.load(baseline)
+    if baseline['lines'] != result['lines']:
+        print 'Baseline of another size, run with --save.'
+        return 1
+    print '{:<10} {} lines, {} entries, parsed in {:.2f}s, {:.0f} lines/s'.\
+        format('baseline', baseline['lines'], baseline['entries'],
+        baseline['seconds'], baseline['lines'] / baseline['seconds'])
+    speedup = baseline['seconds'] / result['seconds']
+    if speedup >= 1:
+        print '\033[32m{:.1f}x\033[39m faster than the baseline'.format(speedup)
+    else:
+        print '\033[31m{:.1f}x\033[39m slower than the baseline'.format(1 / speedup)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
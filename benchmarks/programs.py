@@ -0,0 +1,41 @@
+'''Synthetic programs for the benchmarks, of a size given to each.'''
+
+PROC = '''TO P{0} :A :B [
+    REPEAT :A [
+        FD :B * 2 + {0}
+        RT (360 / :A)
+    ]
+]'''
+
+CALL = 'P{} {} :REPCOUNT'
+
+def entries(procs):
+    'Yields the top level entries of library, procs and REPEATs calling them.'
+    for index in range(procs):
+        yield PROC.format(index)
+        calls = [CALL.format(callee, callee % 7 + 3)
+            for callee in range(max(0, index - 3), index + 1)]
+        yield 'REPEAT 2 [\n{}\n]'.format('\n'.join(calls))
+
+def library(procs):
+    'A wide library of procs, every one followed by a REPEAT calling it.'
+    return '\n'.join(entries(procs))
+
+def nest(depth, count=2):
+    'REPEATs nested depth deep, the innermost runs count ^ depth times.'
+    return '{}FD :REPCOUNT RT 1{}'.format(
+        'REPEAT {} [ '.format(count) * depth, ' ]' * depth)
+
+def chain(terms):
+    'An expression of terms operands, variables and literals.'
+    operators = ['+', '*', '-', '/']
+    operands = [':A', '2', ':B', '3']
+    text = [':A']
+    for index in range(1, terms):
+        text.append(operators[index % 4])
+        text.append(operands[index % 4])
+    return ' '.join(text)
+
+def opcodes(count):
+    'A program emitting count opcodes, moves and turns.'
+    return 'REPEAT {} [ REPEAT 500 [ FD 1 RT 1 ] ]'.format(max(1, count // 1000))
@@ -0,0 +1,217 @@
+'''Times the lexer, the parser, expressions, the tree walker, the bytecode
+and headless execution on synthetic programs, and compares the results
+with a baseline.
+
+Run from the root of the project, `PYTHONPATH=. python benchmarks/suite.py`.
+The options are
+    --quick              programs ten times smaller, a single run each
+    --output FILE        writes the results as JSON
+    --baseline FILE      compares with the results of an earlier run,
+                         exits with 1 if a benchmark is slower by more
+                         than --tolerance, 0.5 by default
+    --save               writes the results to the baseline instead
+
+Every benchmark is timed the best of --repeat runs, 3 by default. The
+results are kept per mode, full or quick, and --save only replaces those
+of the mode run, so that a baseline holds both. The baseline in
+benchmarks/baseline.json was measured on the machine of the last commit
+to change it, so save one of your own before comparing.'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import collections
+
+from logo.compiler.lexer import Lexer
+from logo.compiler.parser import Parser, Ast
+from logo.compiler.expr import ExprParser
+from logo.compiler.codegen import Context
+from logo.runtime.vm import Turtle
+from logo.runtime.headless import Headless
+from logo.runtime.log import Log, OFF
+import programs
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baseline.json')
+VERSION = 2 # of the results, by mode
+
+def consume(opcodes):
+    collections.deque(opcodes, maxlen=0)
+
+def parsed(source):
+    ast = Ast()
+    Parser().parse(ast, source)
+    return ast
+
+def lex(source):
+    lexer = Lexer()
+    def run():
+        # tokens are scanned as they are taken
+        lexer.tokenize(source)
+        while lexer.hastokens():
+            lexer.gettoken()
+    return run
+
+def parse(source):
+    return lambda: parsed(source)
+
+def evaluate(terms, number):
+    lexer = Lexer()
+    lexer.tokenize(programs.chain(terms))
+    expr = ExprParser(lexer).parse()
+    expr.locate([[':A', ':B']])
+    scope = Context()
+    scope.enter([6.0, 100.0])
+    def run():
+        for index in xrange(number):
+            expr.evaluate(scope)
+    return run
+
+def gencode(source):
+    ast = parsed(source)
+    def run():
+        for glob in ast.globals:
+            glob.done = False
+        consume(ast.gencode(Context()))
+    return run
+
+def lower(source, optimize):
+    ast = parsed(source)
+    def run():
+        for glob in ast.globals:
+            glob.done = False
+        ast.compile(optimize)
+    return run
+
+def bytecode(source, optimize):
+    ast = parsed(source)
+    program = ast.compile(optimize)
+    return lambda: consume(program.run())
+
+def execute(source):
+    def run():
+        turtle = Turtle(Headless(), log=Log(OFF))
+        turtle.eval(source)
+    return run
+
+def benchmarks(scale):
+    '''(name, items, unit, function) of every benchmark, the programs
+    scaled down by scale.'''
+    procs = 2000 // scale
+    library = programs.library(procs)
+    lines = library.count('\n') + 1
+    depth = 16 if scale == 1 else 13
+    nest = programs.nest(depth)
+    chain = programs.chain(64)
+    opcodes = 1000000 // scale
+    million = programs.opcodes(opcodes)
+    evaluations = 100000 // scale
+
+    return [
+        ('lex/library', lines, 'lines', lex(library)),
+        ('lex/chain', 1000 // scale, 'expressions',
+            lex('\n'.join([chain] * (1000 // scale)))),
+        ('parse/library', lines, 'lines', parse(library)),
+        ('parse/nest', 1, 'programs', parse(programs.nest(200))),
+        ('parse/chain', 1000 // scale, 'statements',
+            parse('\n'.join(['FD ' + chain] * (1000 // scale)).\
+            replace(':A', '1').replace(':B', '2'))),
+        ('evaluate/chain', evaluations, 'evaluations',
+            evaluate(64, evaluations)),
+        ('gencode/nest', 2 ** depth, 'iterations', gencode(nest)),
+        ('gencode/library', lines, 'lines', gencode(library)),
+        ('compile/library', lines, 'lines', lower(library, 1)),
+        ('compile/library-O2', lines, 'lines', lower(library, 2)),
+        ('run/nest', 2 ** depth, 'iterations', bytecode(nest, 1)),
+        ('run/opcodes', opcodes, 'opcodes', bytecode(million, 1)),
+        ('execute/opcodes', opcodes, 'opcodes', execute(million)),
+    ]
+
+def measure(function, repeat):
+    best = None
+    for index in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def measureall(scale, repeat, stream=sys.stdout):
+    results = collections.OrderedDict()
+    for name, items, unit, function in benchmarks(scale):
+        seconds = measure(function, repeat)
+        results[name] = {'seconds': seconds, 'items': items, 'unit': unit}
+        stream.write('{:<20} {:>10.4f}s {:>14,.0f} {}/s\n'.format(
+            name, seconds, items / seconds, unit))
+    return results
+
+def compare(results, baseline, tolerance, stream=sys.stdout):
+    'Writes the ratio of every time to the baseline, returns the regressions.'
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or before['items'] != result['items']:
+            stream.write('{:<20} {:>10}\n'.format(name, 'new'))
+            continue
+        ratio = result['seconds'] / before['seconds']
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        stream.write('{}{:<20} {:>10.2f}x\033[39m\n'.format(
+            '\033[31m' if regressed else '\033[32m' if ratio < 1 else '',
+            name, ratio))
+    return regressions
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python benchmarks/suite.py',
+        description='Benchmarks the LOGO compiler and runtime.')
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--repeat', type=int)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline', nargs='?', const=BASELINE)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    options = parser.parse_args(arguments)
+
+    mode = 'quick' if options.quick else 'full'
+    scale = 10 if options.quick else 1
+    repeat = options.repeat or (1 if options.quick else 3)
+    results = measureall(scale, repeat)
+    document = {'version': VERSION, 'python': platform.python_version(),
+        'machine': platform.machine(),
+        mode: {'scale': scale, 'repeat': repeat, 'results': results}}
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(document, output, indent=2)
+    if options.save:
+        filename = options.baseline or BASELINE
+        if os.path.isfile(filename):
+            with open(filename, 'r') as baseline:
+                baseline = json.load(baseline)
+            if baseline.get('version') == VERSION:
+                # keeps the results of the other mode
+                baseline.update(document)
+                document = baseline
+        with open(filename, 'w') as output:
+            json.dump(document, output, indent=2, sort_keys=True)
+        return 0
+    if options.baseline:
+        with open(options.baseline, 'r') as baseline:
+            baseline = json.load(baseline)
+        if baseline.get('version') != VERSION or mode not in baseline:
+            print 'Baseline of another version or without {} results, run '\
+                'with --save.'.format(mode)
+            return 1
+        regressions = compare(results, baseline[mode]['results'],
+            options.tolerance)
+        if regressions:
+            print '\033[31m{} slower than the baseline\033[39m: {}'.format(
+                len(regressions), ', '.join(regressions))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
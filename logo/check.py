@@ -0,0 +1,99 @@
+'''Checks that compiled programs draw what the tree walker does.
+
+    python -m logo.check samples/fractals.logo 'TREE 50 5'
+
+Every program is run by the tree walker, then compiled and run at every
+optimize level, and the opcodes drawn are compared, up to the error
+which ended the run if any, so that an optimization evaluating what the
+walker doesn't, or in another order, is caught. The arguments are the
+.logo files loaded, followed by the invocations run after them. Without
+arguments, the samples and the PROGRAMS below are checked.'''
+import sys
+import argparse
+
+from logo.compiler.parser import Parser, Ast
+from logo.compiler.codegen import Context
+
+LEVELS = (0, 1, 2)
+DIGITS = 9 # of the args compared, folding constants may round differently
+
+# libraries, files or sources, with the invocations run after them, some
+# of which broke an optimization
+PROGRAMS = [
+    ('samples/polygon.logo', ['FLOWER 30 100', 'SQUARE 50']),
+    ('samples/fractals.logo', ['TREE 50 5', 'SNOWFLAKE 100 2', 'SPIRAL 20']),
+    ('TO T :N :X [ REPEAT 2 [ REPEAT :N [ FD 1 / :X ] ] ]',
+        ['T 0 0', 'T 2 4']),
+    ('TO T :X [ REPEAT 2 [ IF :X = 0 [ STOP ] FD 1 / :X ] ]', ['T 0', 'T 4']),
+    ('TO G :A [ FD :A ]\nTO H [ G 1E309 ]', ['H']),
+]
+
+def run(source, compiled, optimize):
+    '''The (name, args) of the opcodes the source draws, and the name of
+    the exception which ended it, None if it ran to its end.'''
+    drawn = []
+    try:
+        ast = Ast()
+        Parser().parse(ast, source.upper())
+        if compiled:
+            opcodes = ast.compile(optimize).run()
+        else:
+            opcodes = ast.gencode(Context())
+        for opcode in opcodes:
+            drawn.append((opcode.name,
+                tuple(round(arg, DIGITS) for arg in opcode.args)))
+    except Exception, exc:
+        return drawn, type(exc).__name__
+    return drawn, None
+
+def check(source):
+    'Yields (optimize, expected, found) for every level drawing otherwise.'
+    expected = run(source, False, None)
+    for optimize in LEVELS:
+        found = run(source, True, optimize)
+        # the engines wrap errors differently, that one is raised matters
+        if found[0] != expected[0] or bool(found[1]) != bool(expected[1]):
+            yield optimize, expected, found
+
+def programs(arguments):
+    'Yields the (name, source) of the programs given as arguments.'
+    library = ''.join(open(argument, 'r').read() + '\n'
+        for argument in arguments if argument.endswith('.logo'))
+    invocations = [argument for argument in arguments
+        if not argument.endswith('.logo')]
+    if not invocations:
+        yield ' '.join(arguments), library
+    for invocation in invocations:
+        yield invocation, library + invocation
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m logo.check',
+        description='Checks compiled LOGO programs against the tree walker.')
+    parser.add_argument('programs', nargs='*',
+        help='.logo files, then invocations like `FLOWER 30 100`')
+    options = parser.parse_args(arguments)
+
+    if options.programs:
+        cases = list(programs(options.programs))
+    else:
+        cases = []
+        for library, invocations in PROGRAMS:
+            if library.endswith('.logo'):
+                library = open(library, 'r').read()
+            cases.extend((invocation, library + '\n' + invocation)
+                for invocation in invocations)
+
+    failed = 0
+    for name, source in cases:
+        for optimize, expected, found in check(source):
+            failed += 1
+            print >> sys.stderr, '\033[31m{}\033[39m at optimize={}: walker '\
+                'drew {} opcodes, error {}, compiled {} opcodes, error {}'.\
+                format(name, optimize, len(expected[0]), expected[1],
+                len(found[0]), found[1])
+    print 'Checked {} programs at optimize {}, {} differ'.format(len(cases),
+        ', '.join(map(str, LEVELS)), failed)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import mmap
+import struct
+from array import array
+from collections import namedtuple
+
+from logo.compiler.symbols import SYMBOLS, KEYWORDS, Keyword
+from logo.compiler.expr import lambdify
+from logo.compiler.bytecode import Program, NAMES, EMIT, EMITC, SET, LOOP, \
+    NEXT, CALL, MCALL, TAILCALL, JUMP, BRANCH
+
+# compiled program file, little endian, sections in this order
+#   header        HEADER
+#   string index  INDEX per string, offset in the string pool and length
+#   string pool   keyword and proc names, entities, sources of functions
+#   constants     doubles, the values of EMITC, their types are strings of
+#                 TYPES codes
+#   proc table    PROC per proc called through MCALL
+#   instructions  INSTRUCTION per instruction
+#   line table    LINE per instruction
+#   site table    SITE per call an instruction was inlined from
+# strings, procs and sites are referred to by index, -1 is None
+MAGIC = 'LOGOBC\r\n'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIIIIIII')
+INDEX = struct.Struct('<II')
+PROC = struct.Struct('<iii')        # name, entry, frame size
+INSTRUCTION = struct.Struct('<iiii') # op, a, b, c
+LINE = struct.Struct('<iiiiii')     # line, colspan, entity, first site, sites
+SITE = struct.Struct('<iiii')       # line, colspan, entity
+NONE = -1
+TYPES = {bool: 'b', int: 'i', long: 'i', float: 'd'}
+CONVERSIONS = {'b': bool, 'i': int, 'd': float}
+
+# functions bound in the namespace of a compiled expression, by symbol
+IMPLEMENTED = dict((symbol.function, value) for value, symbol in SYMBOLS.items()
+    if symbol.function)
+
+# stands for the proc in the memo keys of MCALL
+Entry = namedtuple('Entry', ['name', 'entry', 'size'])
+
+class Writer(object):
+    def __init__(self):
+        self.strings = []
+        self.index = {} # string -> index
+        self.constants = array('d')
+        self.procs = []
+        self.sites = []
+
+    def string(self, value):
+        if value is None:
+            return NONE
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def function(self, function):
+        'Index of the source of the function, with what it binds.'
+        bindings = []
+        for key, value in sorted(function.bindings.items()):
+            if isinstance(value, float):
+                bindings.append('{}=F{!r}'.format(key, value))
+            else:
+                bindings.append('{}=S{}'.format(key, IMPLEMENTED[value]))
+        return self.string('{}\0{}'.format(function.source, ';'.join(bindings)))
+
+    def line(self, line):
+        number, colspan, entity = line
+        first, last = colspan if colspan else (NONE, NONE)
+        return (NONE if number is None else number, first, last,
+            self.string(entity))
+
+    def instruction(self, op, a, b, c):
+        if op == EMIT:
+            return op, self.string(a.value), self.function(b), NONE
+        elif op == EMITC:
+            offset = len(self.constants)
+            self.constants.extend(float(value) for value in b)
+            types = ''.join(TYPES[type(value)] for value in b)
+            return op, self.string(a.value), offset, self.string(types)
+        elif op in (SET, BRANCH):
+            return op, a, self.function(b), NONE
+        elif op in (LOOP, CALL, TAILCALL):
+            return op, a, self.function(b), c
+        elif op == MCALL:
+            size, proc = c
+            self.procs.append((self.string(proc.name), a, size))
+            return op, a, self.function(b), len(self.procs) - 1
+        elif op in (NEXT, JUMP):
+            return op, a, NONE if b is None else b, NONE
+        return op, NONE, NONE, NONE
+
+def dump(program, filename):
+    'Writes the compiled program to the file.'
+    writer = Writer()
+    code = [writer.instruction(*instruction) for instruction in program.code]
+    lines = []
+    for line, sites in zip(program.lines, program.sites):
+        lines.append(writer.line(line) + (len(writer.sites), len(sites)))
+        writer.sites.extend(writer.line(site) for site in sites)
+
+    pool = ''.join(writer.strings)
+    with open(filename, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(NAMES), program.size,
+            len(code), len(writer.strings), len(pool), len(writer.constants),
+            len(writer.procs), len(writer.sites)))
+        offset = 0
+        for string in writer.strings:
+            output.write(INDEX.pack(offset, len(string)))
+            offset += len(string)
+        output.write(pool)
+        writer.constants.tofile(output)
+        for proc in writer.procs:
+            output.write(PROC.pack(*proc))
+        for instruction in code:
+            output.write(INSTRUCTION.pack(*instruction))
+        for line in lines:
+            output.write(LINE.pack(*line))
+        for site in writer.sites:
+            output.write(SITE.pack(*site))
+
+class Image(object):
+    'A compiled program file, mapped in memory.'
+    def __init__(self, filename):
+        with open(filename, 'rb') as image:
+            self.buffer = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size:
+            raise ValueError('`{}` is not a compiled program.'.format(filename))
+        magic, version, names, self.size, self.instructions, self.nstrings, \
+            poolsize, self.nconstants, self.nprocs, self.nsites = \
+            HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError('`{}` is not a compiled program.'.format(filename))
+        if version != VERSION or names != len(NAMES):
+            raise ValueError('`{}` was compiled by another version, {}.'.\
+                format(filename, version))
+
+        self.index = HEADER.size
+        self.pool = self.index + INDEX.size * self.nstrings
+        self.constants = self.pool + poolsize
+        self.procs = self.constants + 8 * self.nconstants
+        self.code = self.procs + PROC.size * self.nprocs
+        self.lines = self.code + INSTRUCTION.size * self.instructions
+        self.sites = self.lines + LINE.size * self.instructions
+        self.strings = {}   # index -> string read so far
+        self.functions = {} # index -> function compiled so far
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        if index not in self.strings:
+            offset, length = INDEX.unpack_from(self.buffer,
+                self.index + INDEX.size * index)
+            start = self.pool + offset
+            self.strings[index] = self.buffer[start:start + length]
+        return self.strings[index]
+
+    def function(self, index):
+        if index not in self.functions:
+            source, bindings = self.string(index).split('\0')
+            namespace = {}
+            for binding in filter(None, bindings.split(';')):
+                key, value = binding.split('=', 1)
+                if value[0] == 'F':
+                    namespace[key] = float(value[1:])
+                else:
+                    namespace[key] = SYMBOLS[value[1:]].function
+            self.functions[index] = lambdify(source, namespace)
+        return self.functions[index]
+
+    def keyword(self, index):
+        name = self.string(index)
+        return KEYWORDS.get(name) or Keyword(name, None)
+
+    def line(self, number, first, last, entity):
+        return (None if number == NONE else number,
+            None if first == NONE else (first, last), self.string(entity))
+
+class Thunk(object):
+    '''Stands for a function of a loaded program until it is first called,
+    it is then compiled and put in the instruction instead.'''
+    __slots__ = ('image', 'code', 'pc', 'index')
+
+    def __init__(self, image, code, pc, index):
+        self.image = image
+        self.code = code
+        self.pc = pc
+        self.index = index
+
+    def __call__(self, scope):
+        function = self.image.function(self.index)
+        op, a, b, c = self.code[self.pc]
+        self.code[self.pc] = (op, a, function, c)
+        return function(scope)
+
+class Lines(object):
+    'The line table of a loaded program, read as it is looked up.'
+    def __init__(self, image):
+        self.image = image
+
+    def __len__(self):
+        return self.image.instructions
+
+    def __getitem__(self, pc):
+        number, first, last, entity, site, sites = \
+            LINE.unpack_from(self.image.buffer, self.image.lines + LINE.size * pc)
+        return self.image.line(number, first, last, entity)
+
+class Sites(Lines):
+    def __getitem__(self, pc):
+        image = self.image
+        site, sites = LINE.unpack_from(image.buffer,
+            image.lines + LINE.size * pc)[4:]
+        return tuple(image.line(*SITE.unpack_from(image.buffer,
+            image.sites + SITE.size * index))
+            for index in range(site, site + sites))
+
+def load(filename):
+    '''The program compiled to the file. Nothing is parsed, the functions
+    are compiled the first time they are run, the line tables read when
+    a stack trace needs them.'''
+    image = Image(filename)
+    words = array('i')
+    words.fromstring(image.buffer[image.code:image.lines])
+    constants = array('d')
+    constants.fromstring(image.buffer[image.constants:image.procs])
+    procs = []
+    for index in range(image.nprocs):
+        name, entry, size = PROC.unpack_from(image.buffer,
+            image.procs + PROC.size * index)
+        procs.append(Entry(image.string(name), entry, size))
+
+    program = Program()
+    program.size = image.size
+    program.lines = Lines(image)
+    program.sites = Sites(image)
+    code = program.code
+    for pc in range(image.instructions):
+        op, a, b, c = words[4 * pc:4 * pc + 4]
+        if op == EMIT:
+            a, b = image.keyword(a), Thunk(image, code, pc, b)
+        elif op == EMITC:
+            types = image.string(c)
+            a, b = image.keyword(a), tuple(CONVERSIONS[code](value)
+                for code, value in zip(types, constants[b:b + len(types)]))
+        elif op in (SET, BRANCH, LOOP, CALL, TAILCALL):
+            b = Thunk(image, code, pc, b)
+        elif op == MCALL:
+            b, c = Thunk(image, code, pc, b), (procs[c].size, procs[c])
+        code.append((op, a, b, c))
+    return program
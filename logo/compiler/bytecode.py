@@ -0,0 +1,568 @@
+import math
+import threading
+from collections import OrderedDict
+from logo.compiler.lexer import ParseError
+from logo.compiler.expr import Constant, Variable, tolist, lambdify
+from logo.compiler.codegen import Opcode, MAXDEPTH
+
+# instruction set, every instruction is a tuple (op, a, b, c)
+#   EMIT   keyword, args, -       yield Opcode(keyword, args(frame))
+#   EMITC  keyword, values, -     yield Opcode(keyword, values)
+#   SET    slot, value, -         slot = value(frame)
+#   LOOP   slot, count, target    slot+1 = count, slot = 1,
+#                                 jump to target if count < 1
+#   NEXT   slot, target, -        slot += 1, jump to target if slot <= slot+1
+#   CALL   entry, args, size      push a frame of size slots, jump to entry
+#   MCALL  entry, args, (size, proc)
+#                                 CALL, or replay the opcodes memoized for
+#                                 the same proc and args
+#   TAILCALL entry, args, size    replace the frame by one of size slots,
+#                                 jump to entry
+#   RETURN -, -, -                pop the frame, jump back to the caller
+#   JUMP   target, -, -           jump to target
+#   BRANCH target, condition, -   jump to target if not condition(frame)
+#   HALT   -, -, -                stop
+EMIT, EMITC, SET, LOOP, NEXT, CALL, MCALL, TAILCALL, RETURN, JUMP, BRANCH, \
+    HALT = range(12)
+
+NAMES = ['EMIT', 'EMITC', 'SET', 'LOOP', 'NEXT', 'CALL', 'MCALL', 'TAILCALL',
+    'RETURN', 'JUMP', 'BRANCH', 'HALT']
+
+# optimization levels
+#   0   plain lowering
+#   1   loop invariant arguments are hoisted out of REPEAT,
+#       constant arguments are evaluated at compile time,
+#       calls to procs without RAND are memoized,
+#       calls right before a RETURN reuse the frame of the caller
+#   2   REPEAT with a small constant count is unrolled,
+#       calls to small procs which are not recursive are inlined
+UNROLL = 64 # max number of statements of an unrolled REPEAT
+INLINE = 16 # max number of statements of an inlined proc
+
+TRACEBACK = 16 # number of calls shown at each end of a long stack trace
+
+class Memo(object):
+    '''Opcodes emitted by calls to deterministic procs, by proc and args.
+
+    Least recently used entries are evicted past maxentries, or past
+    maxopcodes in total. Expansions longer than maxlength aren't kept.
+    Programs run on the thread of a Pipeline share it with the REPL,
+    which invalidates entries meanwhile, hence the lock.'''
+
+    def __init__(self, maxentries=1024, maxopcodes=1 << 20, maxlength=1 << 16):
+        self.entries = OrderedDict()
+        self.maxentries = maxentries
+        self.maxopcodes = maxopcodes
+        self.maxlength = maxlength
+        self.opcodes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            expansion = self.entries.pop(key, None)
+            if expansion is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[key] = expansion
+            return expansion
+
+    def put(self, key, expansion):
+        if len(expansion) > self.maxlength:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = expansion
+            self.opcodes += len(expansion)
+            while len(self.entries) > self.maxentries or \
+                    self.opcodes > self.maxopcodes:
+                key, expansion = self.entries.popitem(last=False)
+                self.opcodes -= len(expansion)
+                self.evictions += 1
+
+    def invalidate(self, procnames):
+        'Drops the expansions of the calls to the procs.'
+        if not procnames:
+            return
+        with self.lock:
+            for key in list(self.entries):
+                if key[0].name in procnames:
+                    self.opcodes -= len(self.entries.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.opcodes = 0
+
+    def __repr__(self):
+        return 'Memo(hits: {}, misses: {}, evictions: {}, entries: {}, opcodes: {})'.\
+            format(self.hits, self.misses, self.evictions, len(self.entries),
+            self.opcodes)
+
+class Program(object):
+    'Flat instruction array, lowered from the Ast by the Compiler.'
+    def __init__(self):
+        self.code = []
+        self.lines = [] # (line, colspan, entity) for every instruction
+        self.sites = [] # lines of the calls inlined around every instruction
+        self.size = 0   # number of slots of the global frame
+
+    def run(self, memo=None, maxdepth=MAXDEPTH, frame=None, profile=None):
+        '''Runs from the global frame, of 0s unless given. A profile is
+        stepped before every instruction.'''
+        code = self.code
+        frame = list(frame) if frame is not None else [0] * self.size
+        callstack = [] # (return pc, frame, (memo key, start, generation))
+        pc = 0
+
+        # opcodes emitted since the outermost MCALL being recorded
+        emitted = []
+        recording = 0
+        generation = 0 # bumped when a recording too long is given up
+        maxlength = memo.maxlength if memo else 0
+        if profile is not None:
+            profile.begin(self)
+
+        try:
+            while True:
+                op, a, b, c = code[pc]
+                if profile is not None:
+                    profile.step(pc, callstack)
+                pc += 1
+                if op == EMIT or op == EMITC:
+                    opcode = Opcode(a, b(frame) if op == EMIT else list(b))
+                    if recording:
+                        emitted.append(opcode)
+                        if len(emitted) > maxlength:
+                            del emitted[:]
+                            generation += 1
+                    yield opcode
+                elif op == NEXT:
+                    count = frame[a] + 1
+                    frame[a] = count
+                    if count <= frame[a + 1]:
+                        pc = b
+                elif op == SET:
+                    frame[a] = b(frame)
+                elif op == LOOP:
+                    count = int(b(frame))
+                    frame[a + 1] = count
+                    frame[a] = 1
+                    if count < 1:
+                        pc = c
+                elif op == BRANCH:
+                    if not b(frame):
+                        pc = a
+                elif op == JUMP:
+                    pc = a
+                elif op == CALL:
+                    if len(callstack) >= maxdepth:
+                        raise RuntimeError('Max recursion depth of {} exceeded.'.\
+                            format(maxdepth))
+                    callee = b(frame)
+                    callee.extend([0] * (c - len(callee)))
+                    callstack.append((pc, frame, None))
+                    frame = callee
+                    pc = a
+                elif op == TAILCALL:
+                    callee = b(frame)
+                    callee.extend([0] * (c - len(callee)))
+                    frame = callee
+                    pc = a
+                elif op == MCALL:
+                    if len(callstack) >= maxdepth:
+                        raise RuntimeError('Max recursion depth of {} exceeded.'.\
+                            format(maxdepth))
+                    size, proc = c
+                    callee = b(frame)
+                    record = None
+                    if memo is not None:
+                        key = (proc, tuple(callee))
+                        expansion = memo.get(key)
+                        if expansion is not None:
+                            if recording:
+                                emitted.extend(expansion)
+                                if len(emitted) > maxlength:
+                                    del emitted[:]
+                                    generation += 1
+                            for opcode in expansion:
+                                yield opcode
+                            continue
+                        record = (key, len(emitted), generation)
+                        recording += 1
+                    callee.extend([0] * (size - len(callee)))
+                    callstack.append((pc, frame, record))
+                    frame = callee
+                    pc = a
+                elif op == RETURN:
+                    pc, frame, record = callstack.pop()
+                    if record is not None:
+                        recording -= 1
+                        key, start, started = record
+                        if started == generation:
+                            memo.put(key, emitted[start:])
+                        if not recording:
+                            del emitted[:]
+                else:
+                    break
+        except Exception, exc:
+            print self.traceback(pc - 1, callstack, exc)
+            raise
+        finally:
+            if profile is not None:
+                profile.end()
+
+    def traceback(self, pc, callstack, error):
+        representation = ['\033[32mStack Trace:\033[39m']
+        pcs = [returnpc - 1 for returnpc, frame, record in callstack] + [pc]
+        lines = [site for pc in pcs for site in self.sites[pc] + (self.lines[pc],)]
+        for index, (line, colspan, entity) in enumerate(lines):
+            if TRACEBACK <= index < len(lines) - TRACEBACK:
+                if index == TRACEBACK:
+                    representation.append('... {} more calls'.\
+                        format(len(lines) - 2 * TRACEBACK))
+                continue
+            representation.append('{}: In {}, line {}, colspan {}'.\
+                format(index, entity, line, colspan))
+        representation.append('LogoRuntimeError: {}'.format(repr(error)))
+        return '\n\n\t'.join(representation)
+
+    def __repr__(self):
+        representation = ['\033[32mProgram\033[39m({} slots)'.format(self.size)]
+        for pc, instruction in enumerate(self.code):
+            op, a, b, c = instruction
+            if op == EMIT:
+                operands = a.value
+            elif op == EMITC:
+                operands = '{} {}'.format(a.value, list(b))
+            elif op == SET:
+                operands = '{}'.format(a)
+            elif op == NEXT:
+                operands = '{} {}'.format(a, b)
+            elif op in (JUMP, BRANCH):
+                operands = '{}'.format(a)
+            elif op in (LOOP, CALL, TAILCALL):
+                operands = '{} {}'.format(a, c)
+            elif op == MCALL:
+                operands = '{} {}'.format(a, c[0])
+            else:
+                operands = ''
+            representation.append('{:5d} {:<8} {:<12} ; {}'.format(
+                pc, NAMES[op], operands, self.lines[pc][2]))
+        return '\n'.join(representation)
+
+class Compiler(object):
+    '''Lowers Proc/Repeat/Call/Statement nodes into a Program.
+
+    Variables are resolved to slots of the frame of the enclosing
+    procedure, each REPEAT gets two slots of its own, for :REPCOUNT and
+    for the evaluated count. Without tailcalls, calls before a RETURN
+    keep a frame of their own at any level, as profiles need.'''
+
+    def __init__(self, ast, optimize=1, inline=INLINE, tailcalls=True):
+        self.ast = ast
+        self.optimize = optimize
+        self.inline = inline
+        self.tailcalls = tailcalls
+        self.program = Program()
+        self.slots = {}   # variable name -> python source to load it
+        self.size = 0
+        self.hoisted = {} # id of expression -> python source to load it
+        self.hoisting = False
+        self.entries = {}
+        self.pure = {} # proc name -> deterministic
+        self.sites = () # lines of the calls being inlined
+        self.inlining = set() # names of the procs being inlined
+        self.pending = []
+        self.fixups = []
+        self.stops = None # pcs of the STOPs to patch, None in a proc
+
+    def compile(self, globs):
+        for glob in globs:
+            self.stops = []
+            glob.lower(self)
+            for pc in self.stops:
+                self.patch(pc, JUMP, self.label())
+        return self.finish()
+
+    def invoke(self, proc):
+        '''Lowers a call to the proc, with the arguments in the slots of
+        the global frame, so that the program runs the proc for any
+        arguments given as frame to Program.run.'''
+        self.size = len(proc.arguments)
+        pc = self.emit(proc.token, 'Call `{}`'.format(proc.name), CALL, None,
+            lambdify('scope[:]', {}), None)
+        self.fixups.append((pc, proc))
+        self.pending.append(proc)
+        return self.finish()
+
+    def finish(self):
+        'Lowers the procs called, once the globals are.'
+        self.emit(None, 'Halt', HALT)
+        self.program.size = self.size
+
+        while self.pending:
+            proc = self.pending.pop()
+            if proc.name not in self.entries:
+                self.procedure(proc)
+
+        for pc, proc in self.fixups:
+            op, a, b, c = self.program.code[pc]
+            entry, size = self.entries[proc.name]
+            if op == MCALL:
+                self.program.code[pc] = (op, entry, b, (size, proc))
+            else:
+                self.program.code[pc] = (op, entry, b, size)
+
+        return self.program
+
+    def procedure(self, proc):
+        entry = len(self.program.code)
+        self.slots = {}
+        self.size = 0
+        for argument in proc.arguments:
+            self.slots[argument.value] = 'scope[{}]'.format(self.allocate())
+
+        self.stops = None
+        proc.block.lower(self)
+        self.emit(proc.token, 'Proc `{}`'.format(proc.name), RETURN)
+        self.entries[proc.name] = (entry, self.size)
+
+        if self.optimize >= 1 and self.tailcalls:
+            # tail calls, nothing is left to run in the frame after them
+            code = self.program.code
+            for pc in range(entry, len(code) - 1):
+                op, a, b, c = code[pc]
+                if op in (CALL, MCALL) and code[pc + 1][0] == RETURN:
+                    code[pc] = (TAILCALL, a, b, c)
+
+    def allocate(self):
+        self.size += 1
+        return self.size - 1
+
+    def emit(self, token, entity, op, a=None, b=None, c=None):
+        if token:
+            self.program.lines.append((token.line.number, token.colspan, entity))
+        else:
+            self.program.lines.append((None, None, entity))
+        self.program.sites.append(self.sites)
+        self.program.code.append((op, a, b, c))
+        return len(self.program.code) - 1
+
+    def patch(self, pc, op, a=None, b=None, c=None):
+        self.program.code[pc] = (op, a, b, c)
+
+    def label(self):
+        return len(self.program.code)
+
+    def enterloop(self):
+        'Allocates the loop slots, returns the slot for :REPCOUNT.'
+        slot = self.allocate()
+        self.allocate()
+        return slot, self.bind(':REPCOUNT', 'scope[{}]'.format(slot))
+
+    def exitloop(self, shadowed, hoisted):
+        self.bind(':REPCOUNT', shadowed)
+        if hoisted is not None:
+            for key in hoisted:
+                del self.hoisted[key]
+            self.hoisting = False
+
+    def bind(self, varname, source):
+        'Binds the variable to the source, returns the one it shadows.'
+        shadowed = self.slots.get(varname)
+        if source is None:
+            self.slots.pop(varname, None)
+        else:
+            self.slots[varname] = source
+        return shadowed
+
+    def unrollable(self, repeat):
+        if self.optimize < 2 or not isinstance(repeat.count, Constant):
+            return False
+        return int(repeat.count.value) * repeat.block.size() <= UNROLL
+
+    def hoist(self, token, block):
+        '''Hoists the expressions of the block that don't depend on
+        :REPCOUNT into slots, set before the outermost REPEAT runs.'''
+        if self.optimize < 1 or self.hoisting:
+            return None
+
+        hoisted = []
+        for expr in self.invariants(block.unconditional()):
+            slot = self.allocate()
+            self.emit(token, 'Repeat', SET, slot, expr.compile(self.resolve))
+            self.hoisted[id(expr)] = 'scope[{}]'.format(slot)
+            hoisted.append(id(expr))
+        self.hoisting = True
+        return hoisted
+
+    def invariants(self, exprs):
+        for expr in exprs:
+            if not hasattr(expr, 'operands'):
+                # constants and variables load as cheap as a slot
+                continue
+            variables = expr.variables()
+            if expr.ispure() and not self.isconstant([expr]) and \
+                    ':REPCOUNT' not in variables:
+                yield expr
+            else:
+                for invariant in self.invariants(expr.operands):
+                    yield invariant
+
+    def call(self, token, entity, proc, arguments):
+        if self.inlinable(proc):
+            return self.expand(token, entity, proc, arguments)
+        op = MCALL if self.optimize >= 1 and self.deterministic(proc) else CALL
+        pc = self.emit(token, entity, op, None,
+            tolist(arguments, self.resolve), None)
+        self.fixups.append((pc, proc))
+        self.pending.append(proc)
+        return pc
+
+    def inlinable(self, proc):
+        if self.optimize < 2 or proc.name in self.inlining:
+            return False
+        return proc.block.size() <= self.inline and \
+            not self.recursive(proc.name, proc)
+
+    def recursive(self, procname, proc, visiting=None):
+        'True if the proc calls, maybe through others, procname.'
+        visiting = visiting if visiting is not None else set()
+        visiting.add(proc.name)
+        for callee in set(proc.calls()):
+            if callee == procname:
+                return True
+            if callee not in visiting and \
+                    self.recursive(procname, self.ast.getproc(callee), visiting):
+                return True
+        return False
+
+    def expand(self, token, entity, proc, arguments):
+        '''Lowers the block of the proc in place of the call, with its
+        variables bound to the arguments. Constants and variables are
+        bound as they are, which lets the statements of the proc be
+        evaluated at compile time, other arguments are set in a slot, as
+        are infinite constants, which have no literal.'''
+        slots = {}
+        for variable, argument in zip(proc.arguments, arguments):
+            if isinstance(argument, Constant) and \
+                    not math.isinf(argument.value) and \
+                    not math.isnan(argument.value):
+                slots[variable.value] = repr(argument.value)
+            elif isinstance(argument, Variable) and id(argument) not in self.hoisted:
+                slots[variable.value] = self.resolve(argument)
+            else:
+                slot = self.allocate()
+                self.emit(token, entity, SET, slot, self.expression(argument))
+                slots[variable.value] = 'scope[{}]'.format(slot)
+
+        site = (token.line.number, token.colspan, entity)
+        saved = self.slots, self.sites, self.stops
+        self.slots, self.sites, self.stops = slots, self.sites + (site,), []
+        self.inlining.add(proc.name)
+        pc = self.label()
+        proc.block.lower(self)
+        for stop in self.stops:
+            self.patch(stop, JUMP, self.label())
+        self.inlining.discard(proc.name)
+        self.slots, self.sites, self.stops = saved
+        return pc
+
+    def deterministic(self, proc):
+        '''True if the opcodes of the proc only depend on its arguments.
+
+        The procs it calls, maybe through others, are all found first,
+        then impurity spreads from those which use RAND to their callers
+        until nothing changes, so a cycle of procs calling each other is
+        decided as a whole.'''
+        if proc.name in self.pure:
+            return self.pure[proc.name]
+        callees = {} # proc name -> names of the procs it calls
+        pending = [proc]
+        while pending:
+            found = pending.pop()
+            callees[found.name] = set(found.calls())
+            pending.extend(self.ast.getproc(procname)
+                for procname in callees[found.name]
+                if procname not in callees and procname not in self.pure)
+
+        pure = dict((procname, self.pure.get(procname, True))
+            for procname in set(callees).union(*callees.values()))
+        for procname in callees:
+            pure[procname] = all(expr.ispure() for expr in
+                self.ast.getproc(procname).block.expressions())
+        changed = True
+        while changed:
+            changed = False
+            for procname, calls in callees.items():
+                if pure[procname] and not all(pure[callee] for callee in calls):
+                    pure[procname] = False
+                    changed = True
+
+        self.pure.update(pure)
+        return pure[proc.name]
+
+    def branch(self, token, entity, condition, block):
+        if self.optimize >= 1 and self.isconstant([condition]):
+            try:
+                value = self.expression(condition)(None)
+            except (ArithmeticError, ValueError):
+                pass
+            else:
+                if value:
+                    block.lower(self)
+                return
+        condition = self.expression(condition)
+        pc = self.emit(token, entity, BRANCH, None, condition)
+        block.lower(self)
+        self.patch(pc, BRANCH, self.label(), condition)
+
+    def stop(self, token, entity):
+        'Returns from the proc, or jumps past the global or inlined call.'
+        if self.stops is None:
+            return self.emit(token, entity, RETURN)
+        pc = self.emit(token, entity, JUMP)
+        self.stops.append(pc)
+        return pc
+
+    def statement(self, token, entity, keyword, arguments):
+        if self.optimize >= 1 and self.isconstant(arguments):
+            try:
+                values = tolist(arguments, self.resolve)(None)
+            except (ArithmeticError, ValueError):
+                # left for the runtime to fail with a stack trace
+                pass
+            else:
+                return self.emit(token, entity, EMITC, keyword, tuple(values))
+        return self.emit(token, entity, EMIT, keyword,
+            tolist(arguments, self.resolve))
+
+    def isconstant(self, exprs):
+        'True if none of the expressions loads anything from the frame.'
+        for expr in exprs:
+            if not expr.ispure() or id(expr) in self.hoisted:
+                return False
+            for varname in expr.variables():
+                if self.slots.get(varname, 'scope').startswith('scope'):
+                    return False
+        return True
+
+    def expression(self, expr):
+        'Compiles an expression into a function of the frame.'
+        return expr.compile(self.resolve)
+
+    def resolve(self, node):
+        if id(node) in self.hoisted:
+            return self.hoisted[id(node)]
+        if not isinstance(node, Variable):
+            return None
+        if node.value not in self.slots:
+            raise ParseError('Variable `{}` not found in current scope.'.\
+                format(node.value), node.token.line.number,
+                node.token.colspan)
+        return self.slots[node.value]
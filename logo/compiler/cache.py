@@ -0,0 +1,121 @@
+import os
+import hashlib
+import cPickle as pickle
+
+# bump when the Ast nodes change, so stale entries are never loaded
+VERSION = 3
+
+class ParseCache(object):
+    '''Parsed sources, pickled to disk under the hash of their text.
+
+    An entry holds the procs and globals a source added to the Ast, and
+    the arity of the procs it called without defining them, which the
+    Ast it is loaded into must have for the entry to be used. Entries
+    are evicted least recently used first once the directory grows past
+    maxsize bytes.'''
+
+    def __init__(self, directory=None, maxsize=64 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache', 'logo')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, parser, ast, source, line=1):
+        key = hashlib.sha1('{}\n{}\n{}'.format(VERSION, line, source)).hexdigest()
+        entry = self.get(key)
+        if entry and all(ast.getarity(procname) == arity
+                for procname, arity in entry['requires'].items()):
+            self.hits += 1
+            for proc in entry['procs']:
+                proc.bind(ast)
+                ast.addproc(proc)
+            for glob in entry['globals']:
+                glob.bind(ast)
+                ast.addglobals(glob)
+            return ast
+
+        self.misses += 1
+        procs = dict(ast.procs)
+        count = len(ast.globals)
+        parser.parse(ast, source, line)
+
+        entry = {
+            'procs': [proc for procname, proc in ast.procs.items()
+                if procs.get(procname) is not proc],
+            'globals': ast.globals[count:],
+            'requires': {},
+        }
+        defined = set(proc.name for proc in entry['procs'])
+        for node in entry['procs'] + entry['globals']:
+            for procname in node.calls():
+                if procname not in defined:
+                    entry['requires'][procname] = ast.getarity(procname)
+        self.put(key, entry)
+        return ast
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as cached:
+                entry = pickle.load(cached)
+        except IOError:
+            return None
+        except Exception:
+            # corrupt or written by an incompatible version
+            self.remove(filename)
+            return None
+        os.utime(filename, None) # most recently used
+        return entry
+
+    def put(self, key, entry):
+        filename = self.filename(key)
+        temporary = '{}.{}'.format(filename, os.getpid())
+        with open(temporary, 'wb') as cached:
+            pickle.dump(entry, cached, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, filename)
+        self.evict()
+
+    def entries(self):
+        'The (last use, size, filename) of the entries, oldest first.'
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                filename = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(entrysize for mtime, entrysize, filename in entries)
+        for mtime, entrysize, filename in entries:
+            if size <= self.maxsize:
+                break
+            self.remove(filename)
+            size -= entrysize
+
+    def remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def clear(self):
+        for mtime, size, filename in self.entries():
+            self.remove(filename)
+
+    def __repr__(self):
+        entries = self.entries()
+        return 'ParseCache({}, hits: {}, misses: {}, entries: {}, size: {} bytes)'.\
+            format(self.directory, self.hits, self.misses, len(entries),
+            sum(size for mtime, size, filename in entries))
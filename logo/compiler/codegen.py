@@ -1,5 +1,8 @@
+import sys
 from logo.compiler.stack import Stack
 
+MAXDEPTH = 10000 # max number of nested proc calls
+
 class Opcode(object):
     def __init__(self, name, args):
         self.name = name.value
@@ -10,6 +13,52 @@ class Opcode(object):
             format(self.name, ','.join(map(
                 lambda x: '{:.2f}'.format(x), self.args)))
 
+def trampoline(generator):
+    '''Runs the gencode of a node, which yields opcodes, or the gencode
+    of another node to run to its end before it goes on. The generators
+    are kept on a stack of their own rather than nested, so that deep
+    recursion is bounded by Context.maxdepth, not by that of Python. An
+    exception goes up the stack, thrown into every generator below.'''
+    stack = [generator]
+    top = generator
+    error = None
+    while True:
+        item = None # the generator to run next, None once top is done
+        if error is None:
+            try:
+                for item in top:
+                    if type(item) is not Opcode:
+                        break
+                    yield item
+                else:
+                    item = None
+            except Exception:
+                error = sys.exc_info()
+                item = None
+        else:
+            thrown, error = error, None
+            try:
+                item = top.throw(*thrown)
+            except StopIteration:
+                pass
+            except Exception:
+                error = sys.exc_info()
+            else:
+                if type(item) is Opcode:
+                    yield item
+                    continue
+
+        if item is not None:
+            stack.append(item)
+            top = item
+            continue
+        stack.pop()
+        if not stack:
+            if error is not None:
+                raise error[0], error[1], error[2]
+            return
+        top = stack[-1]
+
 class Trace(object):
     def __init__(self, context):
         self.line = None
@@ -17,11 +66,11 @@ class Trace(object):
         self.entity = None
         self.error = None
         self.context = context
-        self.memento = Stack('`Traceback`')
+        self.memento = Stack(maxsize=None, name='`Traceback`')
 
     def throw(self, error):
         self.error = error
-        print self.context.scope
+        print self.context
         print self
 
     def restore(self):
@@ -60,52 +109,58 @@ class Trace(object):
             format(repr(self.error)))
         return '\n\n\t'.join(representation)
 
-class Scope(object):
-    def __init__(self, context):
-        self.context = context
-        self.stack = Stack('`Scope Stack`')
-        self.variables = {}
-        self.stack.push(self.variables)
-
-    def evaluate(self, varname):
-        if varname not in self.variables:
-            self.context.trace.throw(
-                'Variable `{}` not found in current scope.'.format(varname))
-        return self.variables[varname]
-
-    def duplicate(self):
-        self.stack.push(self.variables.copy())
-
-    def setvar(self, varname, value):
-        self.variables[varname] = value
-
-    def restore(self):
-        if not self.stack.isempty():
-            self.variables = self.stack.pop()
-
-    def __repr__(self):
-        return 'Scope({})'.format(self.variables)
-
 class Context(object):
-    def __init__(self):
-        self.trace = Trace(self)
-        self.scope = Scope(self)
+    '''Runtime state of the tree walker.
 
-    def duplicate(self):
-        self.scope.duplicate()
+    Every proc invocation and every REPEAT pushes a frame, a list with a
+    slot per variable, the parser resolved each variable to the depth of
+    its frame from the top and its slot in there.'''
+    def __init__(self, maxdepth=MAXDEPTH):
+        self.trace = Trace(self)
+        self.frames = [[]] # frame of the globals at the bottom
+        self.depth = 0 # number of nested proc calls
+        self.maxdepth = maxdepth
+
+    def enter(self, frame):
+        self.frames.append(frame)
+        return frame
+
+    def leave(self):
+        self.frames.pop()
+
+    def call(self, arguments):
+        if self.depth >= self.maxdepth:
+            raise RuntimeError('Max recursion depth of {} exceeded.'.\
+                format(self.maxdepth))
+        self.depth += 1
+        self.enter(arguments)
+
+    def ret(self):
+        self.depth -= 1
+        self.leave()
+
+    def mark(self):
+        return len(self.frames), self.trace.memento.size()
+
+    def rewind(self, mark):
+        'Drops the frames and the traces saved after the mark, for STOP.'
+        frames, traces = mark
+        del self.frames[frames:]
+        del self.trace.memento.items[traces:]
+
+    def unwind(self):
+        'Drops the frames left by a run which failed.'
+        del self.frames[1:]
+        self.depth = 0
 
     def savetrace(self, line, colspan, entity):
         self.trace.save(line, colspan, entity)
 
-    def savevar(self, varname, value):
-        self.scope.setvar(varname, value)
-
     def restore(self):
-        self.scope.restore()
         self.trace.restore()
 
-    def evaluate(self, varname):
-        return self.scope.evaluate(varname)
+    def load(self, depth, slot):
+        return self.frames[-1 - depth][slot]
 
     def __repr__(self):
-        return 'Context({})'.format(self.callstack.top())
\ No newline at end of file
+        return 'Context({})'.format(self.frames[-1])
@@ -1,6 +1,9 @@
+import math
 from logo.compiler.stack import Stack
 from logo.compiler.lexer import Token, ParseError
-from logo.compiler.symbols import Symbol, Operators
+from logo.compiler.symbols import SYMBOLS, OPERATORS, FUNCTIONS
+
+SPECIALS = OPERATORS | FUNCTIONS | frozenset(['(', ')', ','])
 
 class ExprParseError(ParseError):
     pass
@@ -30,20 +33,43 @@ class Sep(object):
         return '\033[32mSep\033[39m `{}`'.format(self.value)
 
 class Constant(object):
-    def __init__(self, token):
-        try:
-            value = float(token.value)
-        except ValueError, exc:
-            raise ExprParseError('Expected integer or variable, found `{}`'.\
-                format(token.value),
-                token.line.number, token.colspan)
-        else:
-            self.token = token
-            self.value = value
+    def __init__(self, token, value=None):
+        if value is None:
+            try:
+                value = float(token.value)
+            except ValueError, exc:
+                raise ExprParseError('Expected integer or variable, found `{}`'.\
+                    format(token.value),
+                    token.line.number, token.colspan)
+        self.token = token
+        self.value = value
 
     def evaluate(self, context):
         return self.value
 
+    def interpret(self, context):
+        return self.value
+
+    def fold(self):
+        return self
+
+    def locate(self, scopes):
+        pass
+
+    def variables(self):
+        return set()
+
+    def ispure(self):
+        return True
+
+    def source(self, resolve, namespace):
+        if math.isinf(self.value) or math.isnan(self.value):
+            return name(namespace, self.value)
+        return '({!r})'.format(self.value)
+
+    def compile(self, resolve):
+        return tofunction(self, resolve)
+
     def __repr__(self):
         return '\033[32mConst\033[39m({})'.format(self.value)
 
@@ -62,9 +88,38 @@ class Variable(object):
 
         self.token = token
         self.value = token.value
+        self.depth = None # of the frame from the top, set by locate
+        self.slot = None
 
     def evaluate(self, context):
-        return context.evaluate(self.value)
+        return context.frames[-1 - self.depth][self.slot]
+
+    def interpret(self, context):
+        return context.load(self.depth, self.slot)
+
+    def fold(self):
+        return self
+
+    def locate(self, scopes):
+        'Finds the frame and the slot of the variable in the scopes.'
+        for depth, names in enumerate(reversed(scopes)):
+            if self.value in names:
+                self.depth, self.slot = depth, names.index(self.value)
+                return
+        raise ParseError('Variable `{}` not found in current scope.'.\
+            format(self.value), self.token.line.number, self.token.colspan)
+
+    def variables(self):
+        return set([self.value])
+
+    def ispure(self):
+        return True
+
+    def source(self, resolve, namespace):
+        return resolve(self)
+
+    def compile(self, resolve):
+        return tofunction(self, resolve)
 
     def __repr__(self):
         return '\033[32mVar\033[39m({})'.format(self.value)
@@ -72,20 +127,27 @@ class Variable(object):
 class Operator(object):
     def __init__(self, token):
         symbol = token.value
-        operators = Operators()
-        symbols = operators.getsymbols() + operators.getfunctions()
-
-        if symbol not in symbols:
+        if symbol not in SYMBOLS:
             raise ExprParseError('Expected one of {}, found {}'.\
-                format(symbols, symbol), token.line.number, token.colspan)
+                format(sorted(SYMBOLS), symbol), token.line.number, token.colspan)
 
         self.token = token
         self.value = token.value
-        self.symbol = operators.getsymbol(self.value)
+        self.symbol = SYMBOLS[self.value]
 
     def __repr__(self):
         return '\033[32mOp\033[39m({})'.format(self.value)
 
+    def __getstate__(self):
+        # the symbol is shared, looked up again when unpickled
+        state = self.__dict__.copy()
+        del state['symbol']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.symbol = SYMBOLS[self.value]
+
     def evaluate(self, operands):
         if len(operands) != self.symbol.arity:
             raise RuntimeError('Operator `{}` expected only `{}` operands, found `{}`: {}'.\
@@ -97,26 +159,116 @@ class Expression(object):
         self.operator = operator
         self.operands = operands
         self.token = operator.token
+        self.function = None
 
     def __repr__(self):
         return '\033[32mExpr\033[39m({}, {})'.format(
             self.operator, self.operands)
 
+    def __getstate__(self):
+        # compiled functions can't be pickled, compiled again when needed
+        state = self.__dict__.copy()
+        state['function'] = None
+        return state
+
     def evaluate(self, context):
-        return self.operator.evaluate([operand.evaluate(context)
+        if not self.function:
+            self.function = self.compile(lookup)
+        return self.function(context)
+
+    def interpret(self, context):
+        'Evaluates by walking the operand tree, without compiling.'
+        return self.operator.evaluate([operand.interpret(context)
             for operand in self.operands])
 
+    def fold(self):
+        'Replaces the subtrees with only constant operands by their value.'
+        self.operands = [operand.fold() for operand in self.operands]
+        if not self.operator.symbol.pure or \
+                not all(isinstance(operand, Constant) for operand in self.operands):
+            return self
+        try:
+            value = self.operator.evaluate([operand.value
+                for operand in self.operands])
+        except (ArithmeticError, ValueError):
+            # left for the runtime to fail with a stack trace
+            return self
+        return Constant(self.token, float(value))
+
+    def locate(self, scopes):
+        for operand in self.operands:
+            operand.locate(scopes)
+
+    def variables(self):
+        return set().union(*[operand.variables() for operand in self.operands])
+
+    def ispure(self):
+        return self.operator.symbol.pure and \
+            all(operand.ispure() for operand in self.operands)
+
+    def source(self, resolve, namespace):
+        resolved = resolve(self)
+        if resolved:
+            return resolved
+
+        symbol = self.operator.symbol
+        operands = [operand.source(resolve, namespace)
+            for operand in self.operands]
+        if symbol.template:
+            return symbol.template.format(*operands)
+        return '{}({})'.format(name(namespace, symbol.function),
+            ', '.join(operands))
+
+    def compile(self, resolve):
+        return tofunction(self, resolve)
+
+def name(namespace, value):
+    'Binds value to a fresh name in the namespace of the compiled source.'
+    key = '_{}'.format(len(namespace))
+    namespace[key] = value
+    return key
+
+def lookup(node):
+    'Source of a variable load from the frames of the tree walker.'
+    if isinstance(node, Variable):
+        return 'scope.frames[{}][{}]'.format(-1 - node.depth, node.slot)
+
+def tofunction(expr, resolve):
+    '''Compiles the expression into one python function of the scope.
+
+    resolve(node) gives the python source to load the node from the scope,
+    it must for a Variable and may for any other node, the operators are
+    inlined and the functions bound once.'''
+    namespace = {}
+    source = expr.source(resolve, namespace)
+    return lambdify(source, namespace)
+
+def tolist(exprs, resolve):
+    'Compiles the expressions into one function returning their values.'
+    namespace = {}
+    sources = [expr.source(resolve, namespace) for expr in exprs]
+    return lambdify('[{}]'.format(', '.join(sources)), namespace)
+
+def lambdify(source, namespace):
+    '''The function of the scope returning source. The source and the
+    values bound in the namespace are kept on it, to be serialized.'''
+    bindings = dict(namespace)
+    function = eval('lambda scope: {}'.format(source), namespace)
+    function.source = source
+    function.bindings = bindings
+    return function
+
 class ExprParser(object):
-    def __init__(self, lexer):
+    def __init__(self, lexer, fold=True):
         self.lexer = lexer
-        self.stack = Stack(name='`Operator Stack`')
-        self.output = Stack(name='`Output Stack`')
+        self.fold = fold
+        self.stack = Stack(maxsize=None, name='`Operator Stack`')
+        self.output = Stack(maxsize=None, name='`Output Stack`')
         self.reduced = False
 
     def parse(self):
         # Shunting-yard algorithm
         # While there are tokens to be read:
-        operators = Operators()
         self.stack.flush()
         self.output.flush()
 
@@ -129,8 +281,7 @@ class ExprParser(object):
                 break
 
             # If the token is a number, then push it to the output queue.
-            if token.value not in operators.getsymbols() + \
-                    operators.getfunctions() + ['(', ')', ',']:
+            if token.value not in SPECIALS:
                 if token.value.startswith(':'):
                     operand = Variable(token)
                 else:
@@ -184,12 +335,12 @@ class ExprParser(object):
                         token.line.number, token.colspan)
 
             # If the token is a function token, then push it onto the stack.
-            elif token.value in Operators().getfunctions():
+            elif token.value in FUNCTIONS:
                 operator = Operator(token)
                 self.stack.push(operator)
 
             # If the token is an operator, o1, then:
-            elif token.value in Operators().getsymbols():
+            elif token.value in OPERATORS:
                 operator1 = Operator(token)
 
                 # while there is an operator token o2, at the top of the
@@ -217,10 +368,8 @@ class ExprParser(object):
             # When there are no more tokens to read:
             if self.lexer.hastokens():
                 nexttoken = self.lexer.peektoken()
-                if token.value not in operators.getsymbols() + \
-                    operators.getfunctions() + ['(', ')', ','] and \
-                    nexttoken.value not in operators.getsymbols() + \
-                    operators.getfunctions() + ['(', ')', ',']:
+                if token.value not in SPECIALS and \
+                    nexttoken.value not in SPECIALS:
                     break
 
                 if not nexttoken or nexttoken.value in [';', ']']:
@@ -249,6 +398,8 @@ class ExprParser(object):
                 self.output.top().token.colspan[1]))
 
         expr = self.output.top()
+        if expr and self.fold:
+            expr = expr.fold()
 
         self.stack.flush()
         self.output.flush()
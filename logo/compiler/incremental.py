@@ -0,0 +1,264 @@
+from logo.compiler.lexer import PATTERN, ParseError
+from logo.compiler.parser import Parser
+from logo.compiler.symbols import OPERATORS
+
+# a line ending with one of these goes on with the next one
+CONTINUATIONS = OPERATORS | frozenset(['(', ','])
+BATCH = 64 # max lines grouped in a piece of source, when they are complete
+CHUNK = 8192 # bytes of a streamed file read at a time
+
+def split(source, number=1):
+    '''Splits the source into its TO blocks and the globals in between.
+
+    Yields (procname, text, line) in the order of the source, procname is
+    None for globals. The text starts at line, padded with spaces up to
+    the column it starts at, so that the tokens keep their positions.
+    The source starts at line number.'''
+    linestart = 0  # offset of the current line
+    begin = 0      # offset of the current chunk
+    padding = ''
+    first = number # line of the current chunk
+    tokens = 0     # number of tokens in the current chunk
+    procname = None
+    depth = 0
+    state = None   # 'NAME' right after TO, 'END' right after its block
+
+    for match in PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'newline':
+            number += 1
+            linestart = match.end()
+            continue
+        if kind != 'word' and kind != 'delimiter':
+            continue
+
+        value = match.group()
+        if state == 'END':
+            state = None
+            end = match.end() if value == ';' else match.start()
+            yield procname, padding + source[begin:end], first
+            procname, begin, tokens = None, end, 0
+            padding, first = ' ' * (end - linestart), number
+            if value == ';':
+                continue
+
+        if state == 'NAME':
+            procname, state = value, None
+        elif value == 'TO' and procname is None and depth == 0:
+            if tokens:
+                yield None, padding + source[begin:match.start()], first
+            begin, tokens = match.start(), 0
+            padding, first = ' ' * (begin - linestart), number
+            state = 'NAME'
+        elif value == '[':
+            depth += 1
+        elif value == ']':
+            depth -= 1
+            if depth == 0 and procname is not None:
+                state = 'END'
+        tokens += 1
+
+    if procname is not None or tokens:
+        yield procname, padding + source[begin:], first
+
+def readlines(chunks):
+    '''Yields the lines of the text read a chunk at a time, with whether
+    it is the last line complete in its chunk.'''
+    rest = ''
+    for chunk in chunks:
+        parts = (rest + chunk).split('\n')
+        rest = parts.pop()
+        for index, part in enumerate(parts):
+            yield part + '\n', index == len(parts) - 1
+    if rest:
+        yield rest, True
+
+def pieces(chunks, batch=BATCH):
+    '''Groups the text, read a chunk at a time, into pieces of source
+    which parse on their own, as soon as they are complete.
+
+    A piece can end with a line out of any bracket or parenthesis, not
+    ending with an operator and not in the middle of a TO, the header of
+    which may be on a line of its own. It does at the last line of every
+    chunk, so that what was read runs before more is, and within chunks
+    every batch lines, so that short statements are parsed and compiled
+    at most batch lines at a time. Yields (text, line), where line is the
+    number of the first line of the text.'''
+    text = []
+    first = 1
+    number = 0
+    depth = 0     # of brackets
+    parens = 0
+    proc = False  # between TO and the end of its block
+    last = None
+
+    for content, end in readlines(chunks):
+        number += 1
+        for match in PATTERN.finditer(content):
+            kind = match.lastgroup
+            if kind != 'word' and kind != 'delimiter':
+                continue
+            last = match.group()
+            if last == '[':
+                depth += 1
+            elif last == ']':
+                depth -= 1
+                if depth == 0:
+                    proc = False
+            elif last == '(':
+                parens += 1
+            elif last == ')':
+                parens -= 1
+            elif last == 'TO' and depth == 0:
+                proc = True
+        if not text and last is None:
+            continue # blank lines and comments in between
+        if not text:
+            first = number
+        text.append(content)
+        if (end or len(text) >= batch) and depth <= 0 and parens <= 0 and \
+                not proc and last not in CONTINUATIONS:
+            yield ''.join(text), first
+            text, depth, parens, last = [], 0, 0, None
+
+    if text:
+        yield ''.join(text), first
+
+def lines(proc):
+    'The Line objects of the tokens of the proc.'
+    found = {}
+    nodes = [proc]
+    while nodes:
+        node = nodes.pop()
+        token = getattr(node, 'token', None)
+        if token is not None:
+            found[id(token.line)] = token.line
+        nodes.extend(argument for argument in getattr(node, 'arguments', [])
+            if argument)
+        for attribute in ('count', 'condition', 'block'):
+            if getattr(node, attribute, None):
+                nodes.append(getattr(node, attribute))
+        nodes.extend(getattr(node, 'operands', []))
+        nodes.extend(getattr(node, 'children', []))
+    return found.values()
+
+class Loader(object):
+    '''Loads sources into an Ast, one TO block at a time.
+
+    The text every proc was parsed from is kept. When a source is loaded
+    again, a TO block is only parsed again if its text changed, or if it
+    calls a proc whose number of arguments changed, otherwise the proc
+    parsed before is put back, moved to its new line. Globals are always
+    parsed, they run once.'''
+
+    def __init__(self, ast, cache=None):
+        self.ast = ast
+        self.cache = cache
+        self.blocks = {} # procname -> (text, line, proc) it was parsed from
+        self.files = {}  # filename -> names of the procs it defined
+        self.parsed = 0
+        self.reused = 0
+
+    def load(self, source, filename=None, line=1, cached=True):
+        '''Loads the source, starting at line, returns the names of the
+        procs which changed and of the procs calling them, directly or
+        not. The procs loaded before which no longer parse against it
+        are dropped, then the first ParseError raised. Sources read once,
+        like the pieces of a file streamed, are parsed without the cache
+        when not cached.'''
+        before = dict(self.ast.procs)
+        stale = set() # procs which no longer take the same arguments
+        defined = []
+
+        for procname, text, line in split(source, line):
+            if procname is None:
+                self.parse(text, line, cached)
+                continue
+
+            defined.append(procname)
+            block = self.blocks.get(procname)
+            if block and block[0] == text and \
+                    not (stale and stale.intersection(block[2].calls())):
+                self.reuse(block[2], line - block[1])
+            else:
+                self.parse(text, line, cached)
+            proc = self.ast.getproc(procname)
+            self.blocks[procname] = (text, line, proc)
+            if procname in before and \
+                    len(before[procname].arguments) != len(proc.arguments):
+                stale.add(procname)
+
+        defined = set(defined)
+        if filename is not None:
+            for procname in self.files.get(filename, []):
+                block = self.blocks.get(procname)
+                if procname not in defined and block and \
+                        self.ast.getproc(procname) is block[2]:
+                    self.ast.delproc(procname)
+                    self.blocks.pop(procname, None)
+                    stale.add(procname)
+            self.files[filename] = defined
+
+        # procs loaded from elsewhere which call those changed, dropped if
+        # they no longer parse, and then so are the procs calling them
+        error = None
+        while stale:
+            broken = set()
+            for procname, proc in self.ast.procs.items():
+                block = self.blocks.get(procname)
+                if procname not in defined and block and \
+                        stale.intersection(proc.calls()):
+                    try:
+                        self.parse(block[0], block[1])
+                    except ParseError, exc:
+                        self.ast.delproc(procname)
+                        self.blocks.pop(procname)
+                        broken.add(procname)
+                        error = error or exc
+                        continue
+                    self.blocks[procname] = (block[0], block[1],
+                        self.ast.getproc(procname))
+            stale = broken
+
+        if error:
+            raise error
+        changed = set(procname for procname in set(before) | set(self.ast.procs)
+            if before.get(procname) is not self.ast.getproc(procname))
+        return self.callers(changed)
+
+    def parse(self, text, line, cached=True):
+        self.parsed += 1
+        parser = Parser()
+        if self.cache and cached:
+            self.cache.parse(parser, self.ast, text, line)
+        else:
+            parser.parse(self.ast, text, line)
+
+    def reuse(self, proc, delta):
+        self.reused += 1
+        if delta:
+            for line in lines(proc):
+                line.number += delta
+        self.ast.addproc(proc)
+
+    def callers(self, procnames):
+        'The procs, with those calling them through any number of calls.'
+        if not procnames:
+            return set()
+        callers = {}
+        for procname, proc in self.ast.procs.items():
+            for callee in set(proc.calls()):
+                callers.setdefault(callee, set()).add(procname)
+
+        found = set(procnames)
+        pending = list(procnames)
+        while pending:
+            for caller in callers.get(pending.pop(), ()):
+                if caller not in found:
+                    found.add(caller)
+                    pending.append(caller)
+        return found
+
+    def __repr__(self):
+        return 'Loader(procs: {}, parsed: {}, reused: {})'.\
+            format(len(self.blocks), self.parsed, self.reused)
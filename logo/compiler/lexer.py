@@ -1,5 +1,8 @@
+import re
 from logo.compiler.stack import Stack
-from logo.compiler.symbols import Operators
+from logo.compiler.symbols import OPERATORS
+
+DELIMITERS = OPERATORS | frozenset(['(', ')', ',', '[', ']', ';'])
 
 class ParseError(Exception):
     def __init__(self, message, number, colspan):
@@ -17,88 +20,72 @@ class ParseError(Exception):
             format(self.message, self.number, colinfo)
 
 class Token(object):
-    def __init__(self, chars):
-        self.value = None
-        self.colspan = None
-        self.line = None
+    __slots__ = ('value', 'colspan', 'line')
 
-        if chars:
-            self.value = ''.join([char[0] for char in chars])
-            self.colspan = (chars[0][1], chars[-1][1])
+    def __init__(self, value, colspan, line):
+        self.value = value
+        self.colspan = colspan
+        self.line = line
 
     def __repr__(self):
         return 'Token({}, {})'.format(self.value, self.colspan)
 
 class Line(object):
-    def __init__(self, number, content):
+    __slots__ = ('number',)
+
+    def __init__(self, number):
         self.number = number
-        self.tokens = self.tokenize(content)
-        for token in self.tokens:
-            token.line = self
-
-    def tokenize(self, content):
-        tokens = []
-        content = zip(content, range(1, len(content)+1))
-        chars = []
-        operators = Operators()
-        for char in content:
-            if char[0] in operators.getsymbols() + \
-                    ['(', ')', ',', '[', ']', ';']:
-                chars.append((' ', None))
-                chars.append(char)
-                chars.append((' ', None))
-            else:
-                chars.append(char)
-
-        content = chars
-        chars = []
-
-        for char in content:
-
-            if char[0] in [' ', '\t']:
-                tokens.append(Token(chars))
-                chars = []
-            else:
-                chars.append(char)
-
-        tokens.append(Token(chars))
-
-        tokens = [token for token in tokens if token.value]
-        return tokens
 
     def __repr__(self):
-        return 'Line({}, {})'.format(self.number, self.tokens)
+        return 'Line({})'.format(self.number)
+
+# one pass over the source, comments are whole lines starting with `#`
+PATTERN = re.compile(r'''
+    (?P<comment> ^[ \t]*\#[^\n]*)
+  | (?P<newline> \n)
+  | (?P<space> [ \t\r\f\v]+)
+  | (?P<delimiter> [{0}])
+  | (?P<word> [^{0}\s]+)
+'''.format(re.escape(''.join(sorted(DELIMITERS)))), re.MULTILINE | re.VERBOSE)
+
+def scan(source, number=1):
+    'Yields the tokens of the source, one at a time, from line number.'
+    start = 0 # offset of the current line
+    line = Line(number)
+    for match in PATTERN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'newline':
+            number += 1
+            start = match.end()
+            line = Line(number)
+        elif kind == 'word' or kind == 'delimiter':
+            begin = match.start() - start + 1
+            yield Token(match.group(), (begin, match.end() - start), line)
 
 class Lexer(object):
     def __init__(self):
-        self.lines = []
+        self.tokens = iter(())
+        # the tokens looked ahead or pushed back
         self.stack = Stack(name='`Lexer Stack`')
 
-    def tokenize(self, source):
-        lines = []
-        for number, line in enumerate(source.split('\n')):
-
-            stripped = line.strip()
-            if not stripped or stripped.startswith('#'):
-                continue
-
-            line = Line(number + 1, line)
-            lines.append(line)
-
-        self.lines = lines
-
-        for line in reversed(self.lines):
-            for token in reversed(line.tokens):
-                self.stack.push(token)
+    def tokenize(self, source, line=1):
+        self.tokens = scan(source, line)
+        self.stack.flush()
 
     def peektoken(self):
+        if self.stack.isempty():
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            self.stack.push(token)
         return self.stack.top()
 
     def gettoken(self):
+        self.peektoken()
         return self.stack.pop()
 
     def pushtoken(self, token):
         self.stack.push(token)
 
     def hastokens(self):
-        return not self.stack.isempty()
+        return self.peektoken() is not None
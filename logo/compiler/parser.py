@@ -1,49 +1,103 @@
+from collections import OrderedDict
 from logo.compiler.lexer import Lexer, ParseError
 from logo.compiler.stack import Stack
-from logo.compiler.symbols import Keywords
-from logo.compiler.expr import ExprParser, Variable
+from logo.compiler.symbols import KEYWORDS
+from logo.compiler.expr import ExprParser, Constant, Variable
 from logo.compiler.utils import indent, listify
-from logo.compiler.codegen import Opcode, Context
+from logo.compiler.codegen import Opcode, Context, trampoline
+from logo.compiler.bytecode import Compiler, INLINE, LOOP, NEXT
 
 class LogoRutimeError(Exception):
     pass
 
+class Stopped(Exception):
+    'Raised by STOP, ends the proc call or the global it is in.'
+    pass
+
 class Parser(object):
     def __init__(self):
         self.lexer = Lexer()
         self.stack = Stack()
 
-    def parse(self, ast, content):
-        self.lexer.tokenize(content)
+    def parse(self, ast, content, line=1):
+        'Parses the content into the ast, numbering lines from line.'
+        self.lexer.tokenize(content, line)
 
         while self.lexer.hastokens():
             token = self.lexer.peektoken()
 
-            if token.value == 'REPEAT':
-                repeat = Repeat(self.lexer)
-                repeat.parse(ast)
-                repeat.done = False
-                ast.addglobals(repeat)
+            if token.value in CONSTRUCTS:
+                construct = CONSTRUCTS[token.value](self.lexer)
+                construct.parse(ast)
+                construct.locate([[]])
+                construct.done = False
+                ast.addglobals(construct)
             elif token.value == 'TO':
                 proc = Proc(self.lexer)
                 proc.parse(ast)
+                proc.locate()
                 ast.addproc(proc)
             else:
-                if Keywords().getkw(self.lexer.peektoken()):
+                if self.lexer.peektoken().value in KEYWORDS:
                     statement = Statement(self.lexer)
                     statement.parse(ast)
+                    statement.locate([[]])
                     statement.done = False
                     ast.addglobals(statement)
                 else:
                     invocation = Call(self.lexer)
                     invocation.parse(ast)
+                    invocation.locate([[]])
                     invocation.done = False
                     ast.addglobals(invocation)
         return ast
 
-class Statement(object):
+class Node(object):
+    'Base of the Ast nodes.'
+
+    def nodes(self):
+        'The nodes right below this one.'
+        return []
+
+    def calls(self):
+        'Names of the procs called from this node, or below it.'
+        for node in self.nodes():
+            for procname in node.calls():
+                yield procname
+
+    def unconditional(self):
+        'The expressions evaluated whenever the node runs.'
+        return self.expressions()
+
+    def stops(self):
+        'Whether a STOP may run below the node.'
+        return any(node.stops() for node in self.nodes())
+
+    def locate(self, scopes):
+        '''Resolves the variables below the node to their frame and slot.
+
+        scopes holds the variable names of every frame, the innermost
+        last.'''
+        for node in self.nodes():
+            node.locate(scopes)
+
+    def bind(self, ast):
+        'Attaches the node, and the ones below it, to the ast.'
+        self.ast = ast
+        for node in self.nodes():
+            node.bind(ast)
+
+    def __getstate__(self):
+        # pickled without the lexer and the ast it was parsed with
+        state = self.__dict__.copy()
+        state.pop('lexer', None)
+        state.pop('ast', None)
+        return state
+
+class Statement(Node):
     def __init__(self, lexer):
         self.keyword = None
+        self.token = None
         self.arguments = []
         self.lexer = lexer
 
@@ -52,8 +106,8 @@ class Statement(object):
             format(self.keyword.value, self.arguments)
 
     def gencode(self, context):
-        context.savetrace(self.keyword.token.line.number,
-            self.keyword.token.colspan,
+        context.savetrace(self.token.line.number,
+            self.token.colspan,
             'Stmt `{}`'.format(self.keyword.value))
 
         arguments = []
@@ -68,6 +122,20 @@ class Statement(object):
         yield opcode
         context.restore()
 
+    def lower(self, compiler):
+        compiler.statement(self.token,
+            'Stmt `{}`'.format(self.keyword.value), self.keyword, self.arguments)
+
+    def expressions(self):
+        return self.arguments
+
+    def size(self):
+        return 1
+
+    def locate(self, scopes):
+        for argument in self.arguments:
+            argument.locate(scopes)
+
     def parse(self, ast):
         self.ast = ast
 
@@ -77,16 +145,21 @@ class Statement(object):
             if token.value == ';':
                 break
 
-            keyword = Keywords().getkw(token)
+            keyword = KEYWORDS.get(token.value)
             if not keyword:
                 raise ParseError('Expected keyword, found `{}`'.\
                     format(token.value), token.line.number, token.colspan)
 
             self.keyword = keyword
+            self.token = token
 
             exprparser = ExprParser(self.lexer)
             for index in range(self.keyword.arity):
                 argument = exprparser.parse()
+                if argument is None:
+                    raise ParseError('Keyword `{}` expected `{}` arguments, found only {}'.\
+                        format(token.value, self.keyword.arity, index),
+                        token.line.number, token.colspan)
                 self.arguments.append(argument)
 
             if self.lexer.hastokens():
@@ -95,7 +168,7 @@ class Statement(object):
                     self.lexer.gettoken()
                 break
 
-class Block(object):
+class Block(Node):
     def __init__(self, lexer):
         self.children = []
         self.lexer = lexer
@@ -107,10 +180,31 @@ class Block(object):
 
     def gencode(self, context):
         for child in self.children:
-            for opcode in child.gencode(context):
-                yield opcode
+            yield child.gencode(context)
         context.restore()
 
+    def lower(self, compiler):
+        for child in self.children:
+            child.lower(compiler)
+
+    def expressions(self):
+        return [expr for child in self.children for expr in child.expressions()]
+
+    def unconditional(self):
+        # what comes after a child which may STOP may not run
+        exprs = []
+        for child in self.children:
+            exprs.extend(child.unconditional())
+            if child.stops():
+                break
+        return exprs
+
+    def nodes(self):
+        return self.children
+
+    def size(self):
+        return sum(child.size() for child in self.children)
+
     def parse(self, ast):
         self.ast = ast
 
@@ -123,12 +217,12 @@ class Block(object):
         while self.lexer.hastokens():
             token = self.lexer.peektoken()
 
-            if token.value == 'REPEAT':
-                repeat = Repeat(self.lexer)
-                repeat.parse(ast)
-                self.children.append(repeat)
+            if token.value in CONSTRUCTS:
+                construct = CONSTRUCTS[token.value](self.lexer)
+                construct.parse(ast)
+                self.children.append(construct)
             else:
-                if Keywords().getkw(self.lexer.peektoken()):
+                if self.lexer.peektoken().value in KEYWORDS:
                     statement = Statement(self.lexer)
                     statement.parse(ast)
                     self.children.append(statement)
@@ -146,7 +240,7 @@ class Block(object):
                 self.lexer.gettoken()
                 break
 
-class Repeat(object):
+class Repeat(Node):
     def __init__(self, lexer):
         self.count = None
         self.block = None
@@ -161,13 +255,52 @@ class Repeat(object):
         context.savetrace(self.token.line.number,
             self.token.colspan, 'Repeat')
 
-        for index in range(int(self.count.evaluate(context))):
-            context.savevar(':REPCOUNT', index+1)
-            for opcode in self.block.gencode(context):
-                yield opcode
+        count = int(self.count.evaluate(context))
+        frame = context.enter([0])
+        for index in range(count):
+            frame[0] = index + 1
+            yield self.block.gencode(context)
+        context.leave()
 
         context.restore()
 
+    def lower(self, compiler):
+        if compiler.unrollable(self):
+            for index in range(int(self.count.value)):
+                shadowed = compiler.bind(':REPCOUNT', repr(index + 1))
+                self.block.lower(compiler)
+                compiler.bind(':REPCOUNT', shadowed)
+            return
+
+        count = compiler.expression(self.count)
+        slot, shadowed = compiler.enterloop()
+        loop = compiler.emit(self.token, 'Repeat', LOOP, slot, count)
+        hoisted = compiler.hoist(self.token, self.block)
+        body = compiler.label()
+        self.block.lower(compiler)
+        compiler.emit(self.token, 'Repeat', NEXT, slot, body)
+        compiler.patch(loop, LOOP, slot, count, compiler.label())
+        compiler.exitloop(shadowed, hoisted)
+
+    def expressions(self):
+        return [self.count] + self.block.expressions()
+
+    def unconditional(self):
+        # the block may run no time at all, unless the count says otherwise
+        if isinstance(self.count, Constant) and self.count.value >= 1:
+            return [self.count] + self.block.unconditional()
+        return [self.count]
+
+    def nodes(self):
+        return [self.block]
+
+    def size(self):
+        return self.block.size() + 2
+
+    def locate(self, scopes):
+        self.count.locate(scopes)
+        self.block.locate(scopes + [[':REPCOUNT']])
+
     def parse(self, ast):
         self.ast = ast
 
@@ -197,7 +330,108 @@ class Repeat(object):
                     self.lexer.gettoken()
                 break
 
-class Call(object):
+class If(Node):
+    def __init__(self, lexer):
+        self.condition = None
+        self.block = None
+        self.lexer = lexer
+        self.token = None
+
+    def __repr__(self):
+        return '\033[32mIf\033[39m {} \n\t{})'.\
+            format(self.condition, self.block)
+
+    def gencode(self, context):
+        context.savetrace(self.token.line.number,
+            self.token.colspan, 'If')
+
+        if self.condition.evaluate(context):
+            yield self.block.gencode(context)
+
+        context.restore()
+
+    def lower(self, compiler):
+        compiler.branch(self.token, 'If', self.condition, self.block)
+
+    def expressions(self):
+        return [self.condition] + self.block.expressions()
+
+    def unconditional(self):
+        return [self.condition]
+
+    def nodes(self):
+        return [self.block]
+
+    def size(self):
+        return self.block.size() + 1
+
+    def locate(self, scopes):
+        self.condition.locate(scopes)
+        self.block.locate(scopes)
+
+    def parse(self, ast):
+        self.ast = ast
+
+        while self.lexer.hastokens():
+            token = self.lexer.peektoken()
+            if token.value != 'IF':
+                raise ParseError('Invalid IF construct.',
+                    token.line.number, token.colspan)
+
+            self.token = self.lexer.gettoken()
+
+            condition = ExprParser(self.lexer).parse()
+            if not condition:
+                raise ParseError('Expected condition expression for IF construct.',
+                    token.line.number, token.colspan)
+
+            self.condition = condition
+
+            block = Block(self.lexer)
+            block.parse(ast)
+
+            self.block = block
+
+            if self.lexer.hastokens():
+                token = self.lexer.peektoken()
+                if token.value == ';':
+                    self.lexer.gettoken()
+                break
+
+class Stop(Node):
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.token = None
+
+    def __repr__(self):
+        return '\033[32mStop\033[39m'
+
+    def gencode(self, context):
+        raise Stopped()
+        yield # a generator, like the gencode of the other nodes
+
+    def lower(self, compiler):
+        compiler.stop(self.token, 'Stop')
+
+    def expressions(self):
+        return []
+
+    def stops(self):
+        return True
+
+    def size(self):
+        return 1
+
+    def locate(self, scopes):
+        pass
+
+    def parse(self, ast):
+        self.ast = ast
+        self.token = self.lexer.gettoken()
+        if self.lexer.hastokens() and self.lexer.peektoken().value == ';':
+            self.lexer.gettoken()
+
+class Call(Node):
     def __init__(self, lexer):
         self.procname = None
         self.arguments = []
@@ -215,22 +449,38 @@ class Call(object):
 
         arguments = []
         for argument in self.arguments:
-            if not argument:
-                self.ast.delglobal(self)
-                raise LogoRutimeError('Proc `{}` takes {} arguments: {}.'.\
-                    format(self.procname, len(self.arguments),
-                    [arg.value for arg in proc.arguments]))
-
             argument = argument.evaluate(context)
             arguments.append(argument)
 
-        for var, value in zip(proc.arguments, arguments):
-            context.savevar(var.value, value)
-
-        for opcode in proc.gencode(context):
-            yield opcode
+        mark = context.mark()
+        context.call(arguments)
+        try:
+            yield proc.gencode(context)
+        except Stopped:
+            context.rewind(mark)
+            context.depth -= 1
+        else:
+            context.ret()
         context.restore()
 
+    def lower(self, compiler):
+        proc = self.ast.getproc(self.procname)
+        compiler.call(self.token, 'Call `{}`'.format(self.token.value),
+            proc, self.arguments)
+
+    def expressions(self):
+        return self.arguments
+
+    def size(self):
+        return 1
+
+    def calls(self):
+        yield self.procname
+
+    def locate(self, scopes):
+        for argument in self.arguments:
+            argument.locate(scopes)
+
     def parse(self, ast):
         self.ast = ast
         while self.lexer.hastokens():
@@ -247,8 +497,13 @@ class Call(object):
             self.procname = token.value
 
             exprparser = ExprParser(self.lexer)
-            for index in range(ast.getarity(self.procname)):
+            arity = ast.getarity(self.procname)
+            for index in range(arity):
                 argument = exprparser.parse()
+                if argument is None:
+                    raise ParseError('Proc `{}` expected `{}` arguments, found only {}'.\
+                        format(self.procname, arity, index),
+                        token.line.number, token.colspan)
                 self.arguments.append(argument)
 
             if self.lexer.hastokens():
@@ -257,7 +512,7 @@ class Call(object):
                     self.lexer.gettoken()
                 break
 
-class Proc(object):
+class Proc(Node):
     def __init__(self, lexer):
         self.name = None
         self.arguments = []
@@ -272,11 +527,17 @@ class Proc(object):
         context.savetrace(self.token.line.number,
             self.token.colspan, 'Proc `{}`'.format(self.token.value))
 
-        for opcode in self.block.gencode(context):
-            yield opcode
+        yield self.block.gencode(context)
 
         context.restore()
 
+    def nodes(self):
+        return [self.block]
+
+    def locate(self, scopes=None):
+        'The proc runs in a frame of its own, of its arguments.'
+        self.block.locate([[argument.value for argument in self.arguments]])
+
     def parse(self, ast):
         self.ast = ast
 
@@ -307,8 +568,18 @@ class Proc(object):
                     'for Proc `{}`, found `{}`'.format(self.name.value, token),
                     token.line.number, token.colspan)
 
+            # declared before the block is parsed, so that it can call
+            # itself, and withdrawn if the block doesn't parse
+            previous = ast.getproc(self.name)
+            ast.addproc(self)
             block = Block(self.lexer)
-            block.parse(ast)
+            try:
+                block.parse(ast)
+            except Exception:
+                ast.delproc(self.name)
+                if previous:
+                    ast.addproc(previous)
+                raise
             self.block = block
 
             if self.lexer.hastokens():
@@ -319,19 +590,21 @@ class Proc(object):
 
 class Ast(object):
     def __init__(self):
-        self.procs = []
+        self.procs = OrderedDict() # name -> Proc
         self.globals = []
 
     def merge(self, other):
-        for proc in other.procs:
+        for proc in other.procs.values():
             self.addproc(proc)
         for glob in other.globals:
             self.addglob(glob)
 
     def addproc(self, proc):
-        if self.hasproc(proc.name):
-            self.procs.remove(self.getproc(proc.name))
-        self.procs.append(proc)
+        self.procs.pop(proc.name, None)
+        self.procs[proc.name] = proc
+
+    def delproc(self, procname):
+        self.procs.pop(procname, None)
 
     def addglob(self, glob):
         if glob not in self.globals:
@@ -343,32 +616,55 @@ class Ast(object):
     def delglobal(self, glob):
         self.globals.remove(glob)
 
+    def prune(self):
+        'Forgets the globals run already.'
+        self.globals = [glob for glob in self.globals if not glob.done]
+
     def hasproc(self, procname):
-        for proc in self.procs:
-            if procname == proc.name:
-                return True
-        return False
+        return procname in self.procs
 
     def getprocs(self):
-        return [proc.name for proc in self.procs]
+        return list(self.procs)
 
     def getproc(self, procname):
-        for proc in self.procs:
-            if procname == proc.name:
-                return proc
+        return self.procs.get(procname)
 
     def getarity(self, procname):
-        for proc in self.procs:
-            if procname == proc.name:
-                return len(proc.arguments)
+        proc = self.procs.get(procname)
+        if proc:
+            return len(proc.arguments)
 
     def gencode(self, context):
-        for glob in self.globals:
-            if not glob.done:
-                for opcode in glob.gencode(context):
+        'Walks the globals not run yet, which are marked as run right away.'
+        globs = [glob for glob in self.globals if not glob.done]
+        for glob in globs:
+            glob.done = True
+        return self.walk(globs, context)
+
+    def walk(self, globs, context):
+        context.unwind()
+        for glob in globs:
+            mark = context.mark()
+            try:
+                for opcode in trampoline(glob.gencode(context)):
                     yield opcode
-                glob.done = True
+            except Stopped:
+                context.rewind(mark)
+
+    def compile(self, optimize=1, inline=INLINE, tailcalls=True):
+        'Lowers the globals not run yet into a Program.'
+        globs = [glob for glob in self.globals if not glob.done]
+        for glob in globs:
+            glob.done = True
+        return Compiler(self, optimize, inline, tailcalls).compile(globs)
 
     def __repr__(self):
         return '<Ast>\n{}\n{}\n</Ast>'.format(
-            listify(self.procs), listify(self.globals))
+            listify(self.procs.values()), listify(self.globals))
+
+# statements with a syntax of their own, by their first token
+CONSTRUCTS = {
+    'REPEAT': Repeat,
+    'IF': If,
+    'STOP': Stop,
+}
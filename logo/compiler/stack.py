@@ -5,6 +5,7 @@ class StackUnderflow(Exception):
     pass
 
 class Stack(object):
+    'maxsize of None means unbounded.'
     def __init__(self, maxsize=1000, items=None, name='No Name'):
         self.items = []
         if items:
@@ -40,7 +41,7 @@ class Stack(object):
         return self.items.pop()
 
     def push(self, item):
-        if len(self.items) == self.maxsize:
+        if self.maxsize is not None and len(self.items) >= self.maxsize:
             raise StackOverflow('Stack is full, maxsize: {}'.\
                 format(self.maxsize))
         self.items.append(item)
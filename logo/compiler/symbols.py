@@ -1,13 +1,33 @@
-import copy
 import math
+import operator
 import random
+from collections import namedtuple
+
+# python implementation and, for the operators, an inline python template
+IMPLEMENTATIONS = {
+    '+': (operator.add, '({} + {})'),
+    '-': (operator.sub, '({} - {})'),
+    '*': (operator.mul, '({} * {})'),
+    '/': (operator.div, '({} / {})'),
+    '%': (operator.mod, '({} % {})'),
+    '^': (operator.pow, '({} ** {})'),
+    '<': (operator.lt, '({} < {})'),
+    '>': (operator.gt, '({} > {})'),
+    '=': (operator.eq, '({} == {})'),
+    'SQRT': (math.sqrt, None),
+    'MAX': (max, None),
+    'MIN': (min, None),
+    'RAND': (random.randint, None),
+}
 
 class Symbol(object):
-    def __init__(self, value, precedence, arity, associativity):
+    def __init__(self, value, precedence, arity, associativity, pure=True):
         self.value = value
         self.precedence = precedence
         self.arity = arity
         self.associativity = associativity
+        self.pure = pure # same operands always evaluate to the same value
+        self.function, self.template = IMPLEMENTATIONS.get(value, (None, None))
 
     def isoperator(self):
         return not self.value.isalnum()
@@ -16,85 +36,68 @@ class Symbol(object):
         return self.value.isalnum()
 
     def evaluate(self, operands):
-        if self.value == '+':
-            return operands[0] + operands[1]
-        elif self.value == '-':
-            return operands[0] - operands[1]
-        elif self.value == '*':
-            return operands[0] * operands[1]
-        elif self.value == '/':
-            return operands[0] / operands[1]
-        elif self.value == '%':
-            return operands[0] % operands[1]
-        elif self.value == '^':
-            return operands[0] ** operands[1]
-        elif self.value == 'SQRT':
-            return math.sqrt(operands[0])
-        elif self.value == 'MAX':
-            return max(operands[0], operands[1])
-        elif self.value == 'MIN':
-            return min(operands[0], operands[1])
-        elif self.value == 'RAND':
-            return random.randint(operands[0], operands[1])
-        else:
+        if not self.function:
             raise NotImplementedError('evaluation for operator ' +\
                 '`{}` is not defined'.format(self.value))
+        return self.function(*operands)
+
+SYMBOLS = dict((symbol.value, symbol) for symbol in [
+    Symbol('<', 1, 2, 'LEFT'),
+    Symbol('>', 1, 2, 'LEFT'),
+    Symbol('=', 1, 2, 'LEFT'),
+    Symbol('+', 2, 2, 'LEFT'),
+    Symbol('-', 2, 2, 'LEFT'),
+    Symbol('*', 3, 2, 'LEFT'),
+    Symbol('/', 3, 2, 'LEFT'),
+    Symbol('%', 3, 2, 'LEFT'),
+    Symbol('^', 4, 2, 'RIGHT'),
+    Symbol('SQRT', 5, 1, 'RIGHT'),
+    Symbol('MAX', 5, 2, 'RIGHT'),
+    Symbol('MIN', 5, 2, 'RIGHT'),
+    Symbol('RAND', 5, 2, 'RIGHT', pure=False),
+])
+
+OPERATORS = frozenset(value for value, symbol in SYMBOLS.items()
+    if not symbol.isfunction())
+FUNCTIONS = frozenset(value for value, symbol in SYMBOLS.items()
+    if symbol.isfunction())
 
 class Operators(object):
     def __init__(self):
-        self.symbols = [
-            Symbol('+', 2, 2, 'LEFT'),
-            Symbol('-', 2, 2, 'LEFT'),
-            Symbol('*', 3, 2, 'LEFT'),
-            Symbol('/', 3, 2, 'LEFT'),
-            Symbol('%', 3, 2, 'LEFT'),
-            Symbol('^', 4, 2, 'RIGHT'),
-            Symbol('SQRT', 5, 1, 'RIGHT'),
-            Symbol('MAX', 5, 2, 'RIGHT'),
-            Symbol('MIN', 5, 2, 'RIGHT'),
-            Symbol('RAND', 5, 2, 'RIGHT'),
-        ]
+        self.symbols = SYMBOLS
 
     def getsymbols(self):
-        return [symbol.value for symbol in self.symbols
-            if not symbol.isfunction()]
+        return sorted(OPERATORS)
 
     def getfunctions(self):
-        return [symbol.value for symbol in self.symbols
-            if symbol.isfunction()]
+        return sorted(FUNCTIONS)
 
     def getsymbol(self, value):
-        for symbol in self.symbols:
-            if symbol.value == value:
-                return symbol
-class Keyword(object):
-    def __init__(self, value, arity):
-        self.value = value
-        self.arity = arity
-        self.token = None
+        return SYMBOLS.get(value)
+
+class Keyword(namedtuple('Keyword', ['value', 'arity'])):
+    'Immutable, one instance is shared by all the statements using it.'
+    __slots__ = ()
 
     def __repr__(self):
         return '\033[32mKeyword\033[39m({}, {})'.format(self.value, self.arity)
 
+KEYWORDS = dict((keyword.value, keyword) for keyword in [
+    Keyword('RT', 1),
+    Keyword('FD', 1),
+    Keyword('BK', 1),
+    Keyword('LT', 1),
+    Keyword('PU', 0),
+    Keyword('PD', 0),
+    Keyword('CLEAR', 0),
+    Keyword('HOME', 0),
+    Keyword('RESET', 0),
+    Keyword('SPEED', 1),
+])
 
 class Keywords(object):
     def __init__(self):
-        self.keywords = [
-            Keyword('RT', 1),
-            Keyword('FD', 1),
-            Keyword('BK', 1),
-            Keyword('LT', 1),
-            Keyword('PU', 0),
-            Keyword('PD', 0),
-            Keyword('CLEAR', 0),
-            Keyword('HOME', 0),
-            Keyword('RESET', 0),
-            Keyword('SPEED', 1),
-        ]
+        self.keywords = KEYWORDS
 
     def getkw(self, token):
-        for keyword in self.keywords:
-            if keyword.value == token.value:
-                keyword = copy.deepcopy(keyword)
-                keyword.token = token
-                return keyword
\ No newline at end of file
+        return KEYWORDS.get(token.value)
@@ -0,0 +1,193 @@
+'''Renders many LOGO programs to images, in parallel and without a display.
+
+Every input is either a .logo file, drawn as a whole, or an invocation
+like `FLOWER 30 100`, drawn after the libraries given with -l are loaded.
+
+    python -m logo.render -l samples/polygon.logo -o out -j 8 \\
+        'FLOWER 30 100' 'FLOWER 90 100' samples/fractals.logo
+
+Every worker process loads the libraries once, then parses, compiles and
+draws its jobs with the headless backend. The procs a .logo file defines
+are forgotten after its job, so every job only sees the libraries. The
+images are written to the output directory, with manifest.json giving
+the output, status and timings of every job. With --profile, the time
+spent in every stack of procs of a job is written next to its image, as
+output.folded, in the format of flamegraph.pl.
+
+With --format lbc the programs are compiled to binary files instead,
+which later runs draw as inputs with no parse or compile step.'''
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+from logo.runtime.vm import Turtle
+from logo.runtime.fusion import fuse
+from logo.runtime.log import Log, OFF
+from logo.runtime.headless import Headless
+from logo.runtime.profiler import Profile
+from logo.compiler.cache import ParseCache
+from logo.compiler.bytecode import Memo
+from logo.compiler.incremental import Loader, lines
+from logo.compiler import binary
+
+turtle = None  # of the worker process, with the libraries loaded
+library = None # procs, blocks and files of its Loader, as the libraries left them
+profiling = False
+
+def setup(libraries, optimize, cache, profile=False):
+    'Initializer of the worker processes.'
+    global turtle, library, profiling
+    profiling = profile
+    turtle = Turtle(Headless(), optimize=optimize, fused=True, log=Log(OFF),
+        cache=ParseCache() if cache else None)
+    for filename in libraries:
+        turtle.update(open(filename, 'r').read().upper(), filename)
+    turtle.drain()
+    library = (OrderedDict(turtle.ast.procs), dict(turtle.loader.blocks),
+        dict(turtle.loader.files))
+
+def restore():
+    '''Puts back the procs of the libraries, so that those defined by a
+    job don't leak into the next ones, and forgets the calls recorded
+    in the memo which may have gone through them.'''
+    procs, blocks, files = library
+    changed = set(procname for procname in set(procs) | set(turtle.ast.procs)
+        if procs.get(procname) is not turtle.ast.getproc(procname))
+    for procname, (text, line, proc) in turtle.loader.blocks.items():
+        block = blocks.get(procname)
+        if block and block[2] is proc and block[1] != line:
+            # reused by the job, which moved it to its own lines
+            for found in lines(proc):
+                found.number += block[1] - line
+
+    turtle.ast.procs.clear()
+    turtle.ast.procs.update(procs)
+    turtle.ast.globals = []
+    turtle.loader = Loader(turtle.ast, turtle.cache)
+    turtle.loader.blocks.update(blocks)
+    turtle.loader.files.update(files)
+    turtle.memo.invalidate(turtle.loader.callers(changed))
+
+def render(job):
+    'Draws one job, returns its entry of the manifest.'
+    index, source, filename, output = job
+    entry = {'index': index, 'input': filename or source, 'output': output}
+    started = time.time()
+    profile = Profile() if profiling else None
+    try:
+        turtle.tt = Headless()
+        if filename and filename.endswith('.lbc'):
+            # entries of other programs may collide in a shared Memo
+            opcodes = fuse(binary.load(filename).run(
+                None if profile else Memo(), turtle.maxdepth, profile=profile))
+        else:
+            turtle.drain()
+            turtle.update(source.upper(), filename)
+            if output.endswith('.lbc'):
+                binary.dump(turtle.ast.compile(turtle.optimize, turtle.inline),
+                    output)
+                entry.update(status='ok', total=time.time() - started)
+                return entry
+            opcodes = turtle.generate(profile=profile)
+        compiled = time.time()
+        turtle.draw(opcodes)
+        drawn = time.time()
+        turtle.tt.save(output)
+        saved = time.time()
+        if profile:
+            profile.save(output + '.folded')
+            entry['profile'] = output + '.folded'
+    except Exception, exc:
+        entry.update(status='error', error='{}: {}'.format(
+            type(exc).__name__, exc), total=time.time() - started)
+        return entry
+    finally:
+        restore()
+
+    entry.update(status='ok', segments=sum(turtle.tt.pens),
+        compile=compiled - started, draw=drawn - compiled, save=saved - drawn,
+        total=saved - started)
+    return entry
+
+def slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '_', text).strip('_')[:48] or 'job'
+
+def jobs(inputs, directory, extension):
+    for index, argument in enumerate(inputs):
+        if argument.endswith('.lbc') and os.path.isfile(argument):
+            name = os.path.splitext(os.path.basename(argument))[0]
+            source, filename = None, argument
+        elif argument.endswith('.logo') and os.path.isfile(argument):
+            name = os.path.splitext(os.path.basename(argument))[0]
+            source, filename = open(argument, 'r').read(), argument
+        else:
+            name, source, filename = slug(argument), argument, None
+        output = os.path.join(directory,
+            '{:05d}-{}.{}'.format(index, name, extension))
+        yield index, source, filename, output
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m logo.render',
+        description='Renders LOGO programs to PNG or SVG images, or compiles them.')
+    parser.add_argument('inputs', nargs='*',
+        help='.logo or compiled .lbc files, or invocations like `FLOWER 30 100`')
+    parser.add_argument('-l', '--library', action='append', default=[],
+        help='.logo file of procs to load before every invocation')
+    parser.add_argument('-f', '--file', action='append', default=[],
+        help='file of invocations, one per line')
+    parser.add_argument('-o', '--output', default='.',
+        help='directory of the images and of the manifest')
+    parser.add_argument('-j', '--jobs', type=int,
+        default=multiprocessing.cpu_count(), help='number of processes')
+    parser.add_argument('--format', choices=['png', 'svg', 'lbc'], default='png')
+    parser.add_argument('-O', '--optimize', type=int, default=1)
+    parser.add_argument('--no-cache', action='store_true',
+        help="don't use the parse cache of ~/.cache/logo")
+    parser.add_argument('--profile', action='store_true',
+        help='writes the time per stack of procs of every job, for flamegraph.pl')
+    options = parser.parse_args(arguments)
+
+    inputs = list(options.inputs)
+    for filename in options.file:
+        inputs.extend(line.strip() for line in open(filename, 'r')
+            if line.strip() and not line.startswith('#'))
+    if not inputs:
+        parser.error('nothing to render')
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+
+    started = time.time()
+    initargs = (options.library, options.optimize, not options.no_cache,
+        options.profile)
+    work = list(jobs(inputs, options.output, options.format))
+    if options.jobs > 1:
+        pool = multiprocessing.Pool(options.jobs, setup, initargs)
+        chunksize = max(1, len(work) // (options.jobs * 8))
+        entries = list(pool.imap_unordered(render, work, chunksize))
+        pool.close()
+        pool.join()
+    else:
+        setup(*initargs)
+        entries = [render(job) for job in work]
+    entries.sort(key=lambda entry: entry['index'])
+    elapsed = time.time() - started
+
+    failed = [entry for entry in entries if entry['status'] != 'ok']
+    with open(os.path.join(options.output, 'manifest.json'), 'w') as manifest:
+        json.dump({'jobs': entries, 'processes': options.jobs,
+            'failed': len(failed), 'total': elapsed}, manifest, indent=2)
+
+    for entry in failed:
+        print >> sys.stderr, '\033[31m{input}\033[39m: {error}'.format(**entry)
+    print 'Rendered {} of {} in {:.2f}s with {} processes, see {}'.format(
+        len(entries) - len(failed), len(entries), elapsed, options.jobs,
+        os.path.join(options.output, 'manifest.json'))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
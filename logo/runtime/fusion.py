@@ -0,0 +1,64 @@
+from logo.compiler.symbols import Keyword
+from logo.compiler.codegen import Opcode
+
+PATH = Keyword('PATH', None)
+RT = Keyword('RT', 1)
+MAXPATH = 65536 # max number of moves in one PATH
+
+TURNS = {'RT': 1, 'LT': -1}
+MOVES = {'FD': 1, 'BK': -1}
+
+def fuse(opcodes):
+    '''Peephole pass over an opcode stream.
+
+    Runs of RT/LT are summed into one turn, full turns are dropped, and so
+    are zero length moves. Runs of turns and FD/BK in between any other
+    opcodes become one PATH opcode, with args the pairs (right turn, move),
+    so that the backend draws them with a single redraw.'''
+    path = []
+    turn = 0.0
+    move = 0.0
+
+    for opcode in opcodes:
+        if len(path) >= 2 * MAXPATH:
+            yield Opcode(PATH, path)
+            path = []
+
+        name = opcode.name
+        if name in TURNS:
+            if move:
+                path.extend((turn % 360.0 and turn, move))
+                turn, move = 0.0, 0.0
+            turn += TURNS[name] * opcode.args[0]
+            continue
+
+        if name in MOVES:
+            distance = MOVES[name] * opcode.args[0]
+            if not distance:
+                continue
+            # consecutive moves merge only when going the same way,
+            # FD 10 BK 5 draws more than FD 5
+            if move and (move > 0) != (distance > 0):
+                path.extend((turn % 360.0 and turn, move))
+                turn, move = 0.0, 0.0
+            move += distance
+            continue
+
+        if move:
+            path.extend((turn % 360.0 and turn, move))
+            turn, move = 0.0, 0.0
+        if path:
+            yield Opcode(PATH, path)
+            path = []
+        if turn % 360.0:
+            yield Opcode(RT, [turn])
+        turn = 0.0
+        yield opcode
+
+    if move:
+        path.extend((turn % 360.0 and turn, move))
+        turn = 0.0
+    if path:
+        yield Opcode(PATH, path)
+    if turn % 360.0:
+        yield Opcode(RT, [turn])
@@ -0,0 +1,198 @@
+import math
+import struct
+import zlib
+from array import array
+
+class Headless(object):
+    '''Display-less stand-in for the `turtle` module.
+
+    Implements the subset of the turtle API the LOGO runtime dispatches
+    opcodes to, using the same vector arithmetic as the Tk turtle, but
+    records every move in flat arrays instead of drawing it. The drawing
+    is written out in one pass with `tosvg` or `topng`.'''
+
+    def __init__(self):
+        self.segments = array('d') # x0, y0, x1, y1 for every move
+        self.pens = array('B')     # 1 if the pen was down for the move
+        self.speedvalue = 3
+        self.reset()
+
+    def forward(self, distance):
+        x, y = self.position
+        ox, oy = self.orient
+        self.goto(x + ox * distance, y + oy * distance)
+
+    def back(self, distance):
+        self.forward(-distance)
+
+    def right(self, angle):
+        self.rotate(-angle)
+
+    def left(self, angle):
+        self.rotate(angle)
+
+    def penup(self):
+        self.drawing = False
+
+    def pendown(self):
+        self.drawing = True
+
+    def clear(self):
+        self.segments = array('d')
+        self.pens = array('B')
+
+    def home(self):
+        self.goto(0.0, 0.0)
+        self.setheading(0.0)
+
+    def reset(self):
+        self.clear()
+        self.position = (0.0, 0.0)
+        self.orient = (1.0, 0.0)
+        self.drawing = True
+
+    def speed(self, speed=None):
+        if speed is None:
+            return self.speedvalue
+        self.speedvalue = speed
+
+    fd = forward
+    bk = back
+    rt = right
+    lt = left
+    pu = penup
+    pd = pendown
+
+    def path(self, *args):
+        'Draws the (right turn, move) pairs of a fused PATH opcode.'
+        x, y = self.position
+        pen = 1 if self.drawing else 0
+        points = []
+        for index in range(0, len(args), 2):
+            if args[index]:
+                self.rotate(-args[index])
+            ox, oy = self.orient
+            distance = args[index + 1]
+            x1, y1 = x + ox * distance, y + oy * distance
+            points.extend((x, y, x1, y1))
+            x, y = x1, y1
+        self.segments.extend(points)
+        self.pens.extend([pen] * (len(points) // 4))
+        self.position = (x, y)
+
+    def goto(self, x, y):
+        x0, y0 = self.position
+        self.segments.extend((x0, y0, x, y))
+        self.pens.append(1 if self.drawing else 0)
+        self.position = (x, y)
+
+    def rotate(self, angle):
+        # same as turtle.Vec2D.rotate, so the geometry matches Tk's
+        ox, oy = self.orient
+        angle = angle * math.pi / 180.0
+        c, s = math.cos(angle), math.sin(angle)
+        self.orient = (ox * c - oy * s, oy * c + ox * s)
+
+    def heading(self):
+        ox, oy = self.orient
+        return round(math.atan2(oy, ox) * 180.0 / math.pi, 10) % 360.0
+
+    def setheading(self, angle):
+        angle = angle - self.heading()
+        self.rotate((angle + 180.0) % 360.0 - 180.0)
+
+    def lines(self):
+        'Yields the (x0, y0, x1, y1) of every move drawn with the pen down.'
+        segments = self.segments
+        for index, pen in enumerate(self.pens):
+            if pen:
+                offset = index * 4
+                yield tuple(segments[offset:offset + 4])
+
+    def polylines(self):
+        'Joins consecutive connected lines into lists of points.'
+        points = []
+        for x0, y0, x1, y1 in self.lines():
+            if not points or points[-1] != (x0, y0):
+                if len(points) > 1:
+                    yield points
+                points = [(x0, y0)]
+            points.append((x1, y1))
+        if len(points) > 1:
+            yield points
+
+    def bounds(self):
+        xs, ys = [0.0], [0.0]
+        for x0, y0, x1, y1 in self.lines():
+            xs.extend((x0, x1))
+            ys.extend((y0, y1))
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def tosvg(self, filename, margin=10):
+        xmin, ymin, xmax, ymax = self.bounds()
+        width = xmax - xmin + 2 * margin
+        height = ymax - ymin + 2 * margin
+
+        # turtle y axis points up, svg y axis points down
+        paths = []
+        for points in self.polylines():
+            paths.append('M' + ' L'.join(['{:.2f},{:.2f}'.format(
+                x - xmin + margin, ymax - y + margin) for x, y in points]))
+
+        with open(filename, 'w') as svg:
+            svg.write('<svg xmlns="http://www.w3.org/2000/svg" ' +\
+                'width="{:.0f}" height="{:.0f}">\n'.format(width, height))
+            svg.write('<path fill="none" stroke="black" d="{}"/>\n'.\
+                format(' '.join(paths)))
+            svg.write('</svg>\n')
+
+    def topng(self, filename, margin=10):
+        xmin, ymin, xmax, ymax = self.bounds()
+        width = int(math.ceil(xmax - xmin)) + 2 * margin + 1
+        height = int(math.ceil(ymax - ymin)) + 2 * margin + 1
+
+        # grayscale, one filter byte in front of every row
+        stride = width + 1
+        pixels = bytearray(b'\xff') * (stride * height)
+        for index in range(height):
+            pixels[index * stride] = 0
+
+        for x0, y0, x1, y1 in self.lines():
+            rasterize(pixels, stride,
+                int(round(x0 - xmin)) + margin, int(round(ymax - y0)) + margin,
+                int(round(x1 - xmin)) + margin, int(round(ymax - y1)) + margin)
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + \
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+        with open(filename, 'wb') as png:
+            png.write(b'\x89PNG\r\n\x1a\n')
+            png.write(chunk(b'IHDR',
+                struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+            png.write(chunk(b'IDAT', zlib.compress(bytes(pixels), 6)))
+            png.write(chunk(b'IEND', b''))
+
+    def save(self, filename):
+        if filename.lower().endswith('.svg'):
+            self.tosvg(filename)
+        else:
+            self.topng(filename)
+
+def rasterize(pixels, stride, x0, y0, x1, y1):
+    # Bresenham's line algorithm, columns are offset by the filter byte
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    error = dx + dy
+    while True:
+        pixels[y0 * stride + x0 + 1] = 0
+        if x0 == x1 and y0 == y1:
+            break
+        double = 2 * error
+        if double >= dy:
+            error += dy
+            x0 += sx
+        if double <= dx:
+            error += dx
+            y0 += sy
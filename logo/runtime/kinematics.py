@@ -0,0 +1,131 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from logo.runtime.headless import Headless
+
+MAXRUN = 1 << 16 # max number of moves computed in one go
+
+class Kinematics(object):
+    '''Computes the path of the turtle for a whole opcode stream at once.
+
+    The opcodes are only scanned to collect the turn before every move,
+    its length and the pen state. The headings are then the cumulative
+    sum of the turns, and the vertices the cumulative sums of
+    d*cos(heading) and d*sin(heading), in numpy. HOME, RESET and CLEAR
+    end the run of moves computed together.'''
+
+    def __init__(self):
+        if numpy is None:
+            raise ImportError('Kinematics needs numpy, ' +\
+                'install it with `python -m pip install numpy`')
+        self.reset()
+
+    def reset(self):
+        self.chunks = [] # (segments, pens) of the runs computed so far
+        self.position = (0.0, 0.0)
+        self.heading = 0.0
+        self.drawing = True
+        self.begin()
+
+    def begin(self):
+        self.turns = array('d') # heading change before every move
+        self.moves = array('d')
+        self.pens = array('B')
+        self.turn = 0.0
+
+    def run(self, opcodes):
+        for opcode in opcodes:
+            name, args = opcode.name, opcode.args
+            if name == 'FD':
+                self.move(args[0])
+            elif name == 'RT':
+                self.turn -= args[0]
+            elif name == 'LT':
+                self.turn += args[0]
+            elif name == 'BK':
+                self.move(-args[0])
+            elif name == 'PATH':
+                for index in range(0, len(args), 2):
+                    self.turn -= args[index]
+                    self.move(args[index + 1])
+            elif name == 'PU':
+                self.drawing = False
+            elif name == 'PD':
+                self.drawing = True
+            elif name == 'HOME':
+                self.flush()
+                x, y = self.position
+                self.chunks.append((numpy.array([[x, y, 0.0, 0.0]]),
+                    numpy.array([self.drawing])))
+                self.position = (0.0, 0.0)
+                self.heading = 0.0
+            elif name == 'CLEAR':
+                self.flush()
+                self.chunks = []
+            elif name == 'RESET':
+                self.reset()
+        self.flush()
+        return self
+
+    def move(self, distance):
+        self.turns.append(self.turn)
+        self.moves.append(distance)
+        self.pens.append(self.drawing)
+        self.turn = 0.0
+        if len(self.moves) == MAXRUN:
+            self.flush()
+
+    def flush(self):
+        'Computes the vertices of the pending run of moves.'
+        turn = self.turn
+        if self.moves:
+            headings = self.heading + numpy.cumsum(
+                numpy.frombuffer(self.turns, dtype=numpy.float64))
+            radians = numpy.radians(headings)
+            moves = numpy.frombuffer(self.moves, dtype=numpy.float64)
+
+            x, y = self.position
+            xs = numpy.empty(len(moves) + 1)
+            ys = numpy.empty(len(moves) + 1)
+            xs[0], ys[0] = x, y
+            numpy.cumsum(moves * numpy.cos(radians), out=xs[1:])
+            numpy.cumsum(moves * numpy.sin(radians), out=ys[1:])
+            xs[1:] += x
+            ys[1:] += y
+
+            segments = numpy.column_stack((xs[:-1], ys[:-1], xs[1:], ys[1:]))
+            pens = numpy.frombuffer(self.pens, dtype=numpy.uint8).astype(bool)
+            self.chunks.append((segments, pens))
+
+            self.position = (float(xs[-1]), float(ys[-1]))
+            self.heading = float(headings[-1])
+
+        self.heading = (self.heading + turn) % 360.0
+        self.begin()
+
+    def segments(self):
+        'All the moves as an (n, 4) array of x0, y0, x1, y1.'
+        if not self.chunks:
+            return numpy.empty((0, 4))
+        return numpy.concatenate([segments for segments, pens in self.chunks])
+
+    def mask(self):
+        'True for the moves made with the pen down.'
+        if not self.chunks:
+            return numpy.empty(0, dtype=bool)
+        return numpy.concatenate([pens for segments, pens in self.chunks])
+
+    def lines(self):
+        'Only the moves made with the pen down.'
+        return self.segments()[self.mask()]
+
+    def save(self, filename):
+        'Writes the drawing as SVG or PNG, through the Headless exporters.'
+        headless = Headless()
+        headless.segments = array('d', self.segments().ravel().tolist())
+        headless.pens = array('B', self.mask().astype(numpy.uint8).tolist())
+        headless.save(filename)
@@ -0,0 +1,108 @@
+import sys
+import time
+import struct
+from array import array
+
+# levels
+#   OFF       nothing
+#   SUMMARY   one line at the end of every run
+#   OPCODES   also every opcode as it is drawn
+OFF, SUMMARY, OPCODES = range(3)
+
+# trace file: MAGIC, then a record per opcode, the index of its name and
+# the number of its args, followed by the args as doubles. The first
+# time a name is used, a DEFINE record gives it its index.
+MAGIC = 'LOGOTRC1'
+RECORD = struct.Struct('<BI')
+DEFINE = 255
+BUFFER = 1 << 16
+
+MOVES = frozenset(['FD', 'BK'])
+PENS = {'PU': False, 'PD': True, 'RESET': True} # pen down after them
+
+class Log(object):
+    '''Counts the opcodes drawn in a run, the time it took and the segments
+    drawn, the moves made with the pen down, and writes them out as the
+    level says. Every opcode is also recorded to the binary trace file if
+    one is given.'''
+
+    def __init__(self, level=SUMMARY, tracefile=None, stream=None):
+        self.level = level
+        self.stream = stream or sys.stdout
+        self.trace = open(tracefile, 'wb', BUFFER) if tracefile else None
+        self.names = {} # name -> index in the trace file
+        if self.trace:
+            self.trace.write(MAGIC)
+        self.pen = True # down, as the turtle starts, from one run to the next
+        self.begin()
+
+    def begin(self):
+        self.counts = {}
+        self.segments = 0
+        self.started = None
+
+    def record(self, opcode):
+        if self.started is None:
+            self.started = time.time()
+        name, args = opcode.name, opcode.args
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if name in MOVES:
+            self.segments += self.pen
+        elif name == 'PATH':
+            self.segments += self.pen * (len(args) // 2)
+        elif name in PENS:
+            self.pen = PENS[name]
+
+        if self.level >= OPCODES:
+            self.stream.write('executing ... {!r}\n'.format(opcode))
+        if self.trace:
+            self.write(name, args)
+
+    def write(self, name, args):
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+            self.trace.write(RECORD.pack(DEFINE, len(name)) + chr(index) + name)
+        self.trace.write(RECORD.pack(index, len(args)))
+        array('d', args).tofile(self.trace)
+
+    def end(self):
+        'Writes the summary of the run, and starts a new one.'
+        if self.level >= SUMMARY and self.counts:
+            elapsed = time.time() - self.started
+            self.stream.write('\033[36m{} opcodes, {} segments in {:.3f}s\033[39m: {}\n'.\
+                format(sum(self.counts.values()), self.segments, elapsed,
+                ', '.join('{} {}'.format(name, count)
+                    for name, count in sorted(self.counts.items()))))
+        if self.trace:
+            self.trace.flush()
+        self.begin()
+
+    def close(self):
+        if self.trace:
+            self.trace.close()
+            self.trace = None
+
+def read(filename):
+    'Yields the (name, args) recorded in a trace file.'
+    names = {}
+    with open(filename, 'rb') as trace:
+        if trace.read(len(MAGIC)) != MAGIC:
+            raise ValueError('`{}` is not a trace file.'.format(filename))
+        while True:
+            header = trace.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            index, length = RECORD.unpack(header)
+            if index == DEFINE:
+                definition = trace.read(length + 1)
+                names[ord(definition[0])] = definition[1:]
+                continue
+            args = array('d')
+            args.fromfile(trace, length)
+            yield names[index], args.tolist()
+
+if __name__ == '__main__':
+    # prints a trace file, e.g. `python -m logo.runtime.log trace.bin`
+    for name, args in read(sys.argv[1]):
+        print name, ' '.join('{:.2f}'.format(arg) for arg in args)
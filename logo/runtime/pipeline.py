@@ -0,0 +1,115 @@
+import time
+import Queue
+import threading
+
+BATCH = 256   # opcodes handed over to the backend at once
+MAXQUEUE = 64 # batches waiting to be drawn, the producer blocks past it
+SLICE = 0.04  # seconds spent drawing per turn of the Tk event loop
+INTERVAL = 10 # milliseconds between two turns
+
+class Pipeline(object):
+    '''Generates the opcodes on a thread of its own, while the backend
+    draws them in batches.
+
+    Programs submitted are drawn one after the other. With Tk, the
+    batches are drawn from a timer of its event loop, so that the REPL
+    keeps reading commands meanwhile. At SPEED 0, the tracer is off and
+    the screen updated once per turn, at other speeds the moves of the
+    turtle are animated as usual. Other backends draw with wait().
+    cancel() drops the program being drawn and those waiting.'''
+
+    def __init__(self, turtle, batch=BATCH, maxqueue=MAXQUEUE):
+        self.turtle = turtle
+        self.batch = batch
+        self.jobs = Queue.Queue()
+        self.batches = Queue.Queue(maxqueue)
+        self.generation = 0 # bumped by cancel, older batches are dropped
+        self.pending = 0    # programs submitted and not drawn yet
+        self.pumping = False
+        self.error = None
+
+        producer = threading.Thread(target=self.produce, name='Producer')
+        producer.daemon = True
+        producer.start()
+
+    def submit(self, opcodes):
+        self.pending += 1
+        self.jobs.put((self.generation, opcodes))
+        if hasattr(self.turtle.tt, 'ontimer') and not self.pumping:
+            self.pumping = True
+            self.turtle.tt.ontimer(self.pump, 0)
+
+    def cancel(self):
+        self.generation += 1
+
+    def produce(self):
+        while True:
+            generation, opcodes = self.jobs.get()
+            batch = []
+            try:
+                for opcode in opcodes:
+                    if generation != self.generation:
+                        opcodes.close()
+                        break
+                    batch.append(opcode)
+                    if len(batch) == self.batch:
+                        self.batches.put((generation, batch))
+                        batch = []
+                self.batches.put((generation, batch))
+            except Exception, exc:
+                self.batches.put((generation, batch))
+                self.batches.put((generation, exc))
+            self.batches.put((generation, None)) # end of the program
+
+    def step(self, block):
+        'Draws the next batch, False if none was ready.'
+        try:
+            generation, batch = self.batches.get(block)
+        except Queue.Empty:
+            return False
+
+        if batch is None:
+            self.pending -= 1
+            self.turtle.log.end()
+        elif generation != self.generation:
+            pass
+        elif isinstance(batch, Exception):
+            self.error = batch
+        else:
+            for opcode in batch:
+                self.turtle.execute(opcode)
+        return True
+
+    def pump(self):
+        'Draws for a slice of time, from a timer of the Tk event loop.'
+        tt = self.turtle.tt
+        tracer = tt.tracer()
+        if self.turtle.speed == 0:
+            tt.tracer(0)
+        deadline = time.time() + SLICE
+        try:
+            while self.pending and time.time() < deadline and self.step(False):
+                pass
+        finally:
+            tt.update()
+            tt.tracer(tracer)
+
+        if self.error:
+            print '\033[31m{}\033[39m'.format(repr(self.error))
+            self.error = None
+        if self.pending:
+            tt.ontimer(self.pump, INTERVAL)
+        else:
+            self.pumping = False
+
+    def wait(self):
+        'Draws until every program submitted is, raises their error if any.'
+        while self.pending:
+            self.step(True)
+        error, self.error = self.error, None
+        if error:
+            raise error
+
+    def __repr__(self):
+        return 'Pipeline(pending: {}, queued: {})'.\
+            format(self.pending, self.batches.qsize())
@@ -0,0 +1,190 @@
+import re
+import timeit
+
+from logo.compiler.bytecode import EMIT, EMITC, SET, LOOP, CALL, MCALL, \
+    TAILCALL, BRANCH, RETURN, HALT
+
+GLOBAL = 'GLOBAL' # stands for the globals in the stacks of procs
+NAME = re.compile(r'`(.*)`')
+EMITS = frozenset([EMIT, EMITC])
+EVALUATES = frozenset([EMIT, SET, LOOP, CALL, MCALL, TAILCALL, BRANCH])
+
+def procedures(program):
+    '''The name of the proc every instruction is in. The procs are laid
+    out after the HALT of the globals, each ending with its RETURN.'''
+    code, lines = program.code, program.lines
+    names = [GLOBAL] * len(code)
+    halt = next(pc for pc, instruction in enumerate(code)
+        if instruction[0] == HALT)
+    name = GLOBAL
+    for pc in range(len(code) - 1, halt, -1):
+        entity = lines[pc][2]
+        if code[pc][0] == RETURN and entity.startswith('Proc '):
+            name = NAME.search(entity).group(1)
+        names[pc] = name
+    return names
+
+class Profile(object):
+    '''Cost of the runs of Programs, per source line and per proc.
+
+    Program.run steps it before every instruction. It counts the
+    instructions run, the opcodes they emit and the expressions they
+    evaluate, and gives the time since the step before, drawing the
+    opcode emitted included, to the instruction before. The instructions
+    of an inlined call go to the proc called, from the sites of their
+    lines. Times are also summed per stack of procs, for flamegraphs.
+
+    Calls replayed from a Memo cost nothing but the MCALL, and tail calls
+    run in the frame of their caller, so profiles are best run without
+    either, as Turtle.generate does.'''
+
+    def __init__(self, clock=timeit.default_timer):
+        self.clock = clock
+        self.lines = {}  # (proc, line, entity) -> [runs, opcodes, evaluations, seconds]
+        self.procs = {}  # name -> [calls, opcodes, evaluations, seconds]
+        self.stacks = {} # names of the procs, outermost first -> seconds
+        self.program = None
+
+    def begin(self, program):
+        self.program = program
+        names = procedures(program)
+        self.frames = [(names[pc],) + tuple(NAME.search(entity).group(1)
+            for line, colspan, entity in program.sites[pc])
+            for pc in range(len(names))]
+        self.entries = set(a for op, a, b, c in program.code
+            if op in (CALL, MCALL, TAILCALL))
+        self.runs = [0] * len(names)
+        self.seconds = [0.0] * len(names)
+
+        # nodes of the tree of stacks, by index, 0 is the root
+        self.nodes = {} # (parent, frame) -> index
+        self.parents = [None]
+        self.labels = [()]
+        self.times = [0.0]
+        self.path = [] # node of every depth of the call stack
+
+        self.pc = None
+        self.node = 0
+        self.last = self.clock()
+
+    def step(self, pc, callstack):
+        now = self.clock()
+        if self.pc is not None:
+            elapsed = now - self.last
+            self.seconds[self.pc] += elapsed
+            self.times[self.node] += elapsed
+        self.runs[pc] += 1
+
+        depth = len(callstack)
+        path = self.path
+        if len(path) > depth + 1:
+            del path[depth + 1:]
+        while len(path) < depth + 1:
+            path.append(0)
+        frame = self.frames[pc]
+        parent = path[depth - 1] if depth else 0
+        node = path[depth]
+        if not node or self.parents[node] != parent or self.labels[node] != frame:
+            node = self.nodes.get((parent, frame))
+            if node is None:
+                node = self.nodes[(parent, frame)] = len(self.labels)
+                self.parents.append(parent)
+                self.labels.append(frame)
+                self.times.append(0.0)
+            path[depth] = node
+
+        self.pc = pc
+        self.node = node
+        self.last = self.clock() # the time spent here is not counted
+
+    def end(self):
+        'Adds up the run of the program.'
+        if self.program is None:
+            return
+        if self.pc is not None:
+            elapsed = self.clock() - self.last
+            self.seconds[self.pc] += elapsed
+            self.times[self.node] += elapsed
+
+        code, lines = self.program.code, self.program.lines
+        for pc, runs in enumerate(self.runs):
+            if not runs:
+                continue
+            op = code[pc][0]
+            line, colspan, entity = lines[pc]
+            counts = (runs, runs if op in EMITS else 0,
+                runs if op in EVALUATES else 0, self.seconds[pc])
+            name = self.frames[pc][-1]
+            add(self.lines, (name, line, entity), counts)
+            add(self.procs, name, (runs if pc in self.entries else 0,) +\
+                counts[1:])
+
+        for node, seconds in enumerate(self.times):
+            if node:
+                stack = self.stack(node)
+                self.stacks[stack] = self.stacks.get(stack, 0.0) + seconds
+        self.program = None
+
+    def stack(self, node):
+        frames = []
+        while node:
+            frames.append(self.labels[node])
+            node = self.parents[node]
+        return tuple(name for frame in reversed(frames) for name in frame)
+
+    def total(self):
+        return sum(self.stacks.values())
+
+    def inclusive(self):
+        'Seconds spent in every proc, and in the procs it called.'
+        seconds = {}
+        for stack, elapsed in self.stacks.items():
+            for name in set(stack):
+                seconds[name] = seconds.get(name, 0.0) + elapsed
+        return seconds
+
+    def folded(self):
+        '''Yields the stacks in the folded format of flamegraph.pl, names
+        joined by `;` then the microseconds spent in them.'''
+        for stack, seconds in sorted(self.stacks.items()):
+            microseconds = int(round(seconds * 1e6))
+            if microseconds:
+                yield '{} {}'.format(';'.join(stack), microseconds)
+
+    def save(self, filename):
+        'Writes the folded stacks, for `flamegraph.pl profile.folded`.'
+        with open(filename, 'w') as output:
+            for line in self.folded():
+                output.write(line + '\n')
+
+    def report(self, limit=20):
+        total = self.total() or 1.0
+        inclusive = self.inclusive()
+        representation = ['\033[36m{:<24} {:>8} {:>10} {:>12} {:>10} {:>10}\033[39m'.\
+            format('proc', 'calls', 'opcodes', 'evaluations', 'self', 'total')]
+        for name, (calls, opcodes, evaluations, seconds) in sorted(
+                self.procs.items(), key=lambda item: -inclusive.get(item[0], 0)):
+            representation.append('{:<24} {:>8} {:>10} {:>12} {:>9.1f}% {:>9.1f}%'.\
+                format(name, calls, opcodes, evaluations, 100 * seconds / total,
+                100 * inclusive.get(name, 0) / total))
+
+        representation.append('\033[36m{:<24} {:<20} {:>8} {:>10} {:>12} {:>10}\033[39m'.\
+            format('line', 'entity', 'runs', 'opcodes', 'evaluations', 'time'))
+        for (name, line, entity), (runs, opcodes, evaluations, seconds) in sorted(
+                self.lines.items(), key=lambda item: -item[1][3])[:limit]:
+            representation.append('{:<24} {:<20} {:>8} {:>10} {:>12} {:>9.1f}%'.\
+                format('{}:{}'.format(name, '-' if line is None else line),
+                entity, runs, opcodes, evaluations, 100 * seconds / total))
+        representation.append('{:.3f}s in all'.format(self.total()))
+        return '\n'.join(representation)
+
+    def __repr__(self):
+        return self.report()
+
+def add(table, key, counts):
+    row = table.get(key)
+    if row is None:
+        table[key] = list(counts)
+    else:
+        for index, count in enumerate(counts):
+            row[index] += count
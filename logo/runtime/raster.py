@@ -0,0 +1,195 @@
+import zlib
+import struct
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from logo.runtime.headless import Headless
+
+TILE = 256 # side of a tile, in pixels
+LEVEL = 6  # of zlib
+
+class Raster(Headless):
+    '''Headless turtle which writes big PNGs, tile by tile on a pool of
+    processes.
+
+    The lines are binned into tiles of the image. The tiles of a row
+    of them, a band, are rasterized with numpy into a band buffer in
+    shared memory, every band then deflated on its own by a worker too,
+    ended with a full flush so that the bands join into a single zlib
+    stream. A band buffer per process is in use at a time, so memory
+    is bounded by the width of the image times the side of the tiles,
+    not by its height.'''
+
+    def __init__(self, scale=1.0, width=None, processes=None, tile=TILE):
+        if numpy is None:
+            raise ImportError('Raster needs numpy, ' +\
+                'install it with `python -m pip install numpy`')
+        self.scale = scale # pixels per turtle unit
+        self.width = width # of the image, the scale is then fitted to it
+        self.processes = processes or multiprocessing.cpu_count()
+        self.tile = tile
+        Headless.__init__(self)
+
+    def topng(self, filename, margin=10):
+        xmin, ymin, xmax, ymax = self.bounds()
+        scale = self.scale
+        if self.width:
+            scale = float(self.width - 2 * margin - 1) / max(xmax - xmin, 1e-9)
+        width = int(numpy.ceil((xmax - xmin) * scale)) + 2 * margin + 1
+        height = int(numpy.ceil((ymax - ymin) * scale)) + 2 * margin + 1
+
+        # in pixels, y pointing down
+        lines = numpy.frombuffer(self.segments, dtype=numpy.float64).\
+            reshape(-1, 4)[numpy.frombuffer(self.pens, dtype=numpy.uint8) > 0]
+        lines = numpy.column_stack((
+            (lines[:, 0] - xmin) * scale + margin, (ymax - lines[:, 1]) * scale + margin,
+            (lines[:, 2] - xmin) * scale + margin, (ymax - lines[:, 3]) * scale + margin))
+
+        tile = self.tile
+        bands = (height + tile - 1) // tile
+        processes = min(self.processes, bands)
+        slots = [RawArray('B', tile * (width + 1)) for slot in range(processes)]
+        for slot in slots:
+            blank(slot, width)
+
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, setup, (slots, width, tile))
+            apply = pool.map
+        else:
+            setup(slots, width, tile)
+            apply = map
+
+        with open(filename, 'wb') as png:
+            png.write(b'\x89PNG\r\n\x1a\n')
+            png.write(chunk(b'IHDR',
+                struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+            png.write(chunk(b'IDAT', b'\x78\x9c')) # zlib header
+            checksum = 1
+            try:
+                for first in range(0, bands, processes):
+                    group = range(first, min(first + processes, bands))
+                    apply(rasterize, [job for slot, band in enumerate(group)
+                        for job in self.jobs(lines, slot, band, width)])
+                    for data, adler, length in apply(deflate,
+                            [(slot, min(tile, height - band * tile), band == bands - 1)
+                            for slot, band in enumerate(group)]):
+                        png.write(chunk(b'IDAT', data))
+                        checksum = combine(checksum, adler, length)
+            finally:
+                if pool:
+                    pool.terminate()
+                    pool.join()
+            png.write(chunk(b'IDAT', struct.pack('>I', checksum)))
+            png.write(chunk(b'IEND', b''))
+
+    def jobs(self, lines, slot, band, width):
+        'The tiles of the band and the lines crossing them.'
+        tile = self.tile
+        top = band * tile
+        ys = lines[:, 1::2]
+        lines = lines[(ys.max(axis=1) >= top - 1) & (ys.min(axis=1) <= top + tile)]
+        xs = lines[:, 0::2]
+        low, high = xs.min(axis=1), xs.max(axis=1)
+        for left in range(0, width, tile):
+            crossing = lines[(high >= left - 1) & (low <= left + tile)]
+            if len(crossing):
+                yield slot, top, left, crossing
+
+def chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + \
+        struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def blank(slot, width):
+    'White, with the filter byte of every row 0.'
+    pixels = numpy.frombuffer(slot, dtype=numpy.uint8).reshape(-1, width + 1)
+    pixels[:, 0] = 0
+    pixels[:, 1:] = 255
+
+def combine(adler1, adler2, length2):
+    'The adler32 of two strings joined, from theirs, as in zlib.'
+    base = 65521
+    remainder = length2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + base - remainder
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+bands = None # of the worker process, its views of the shared band buffers
+tile = None
+
+def setup(slots, width, side):
+    'Initializer of the worker processes.'
+    global bands, tile
+    bands = [numpy.frombuffer(slot, dtype=numpy.uint8).reshape(-1, width + 1)
+        for slot in slots]
+    tile = side
+
+def rasterize(job):
+    '''Draws the lines in the tile. Every line is sampled at the integer
+    coordinates of its major axis, so lines crossing tiles get the same
+    pixels as if drawn at once.'''
+    slot, top, left, lines = job
+    pixels = bands[slot]
+    x0, y0, x1, y1 = lines.T
+    steep = numpy.abs(y1 - y0) > numpy.abs(x1 - x0)
+    a0, a1 = numpy.where(steep, y0, x0), numpy.where(steep, y1, x1)
+    b0, b1 = numpy.where(steep, x0, y0), numpy.where(steep, x1, y1)
+    backward = a1 < a0
+    a0, a1 = numpy.where(backward, a1, a0), numpy.where(backward, a0, a1)
+    b0, b1 = numpy.where(backward, b1, b0), numpy.where(backward, b0, b1)
+    slope = (b1 - b0) / numpy.where(a1 > a0, a1 - a0, 1.0)
+
+    # the major coordinates within the tile, on both axes
+    low = numpy.where(steep, top, left)
+    start = numpy.maximum(numpy.ceil(a0), low)
+    stop = numpy.minimum(numpy.floor(a1), low + tile - 1)
+    minor = numpy.where(steep, left, top)
+    flat = slope == 0
+    divisor = numpy.where(flat, 1.0, slope)
+    enter = a0 + (minor - 0.5 - b0) / divisor
+    leave = a0 + (minor + tile - 0.5 - b0) / divisor
+    start = numpy.maximum(start, numpy.where(flat, start,
+        numpy.floor(numpy.minimum(enter, leave))))
+    stop = numpy.minimum(stop, numpy.where(flat, stop,
+        numpy.ceil(numpy.maximum(enter, leave))))
+    counts = numpy.maximum(stop - start + 1, 0).astype(numpy.int64)
+    index = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.arange(counts.sum()) - \
+        numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    a = start[index] + offsets
+    b = numpy.rint(b0[index] + (a - a0[index]) * slope[index])
+    xs = numpy.concatenate((numpy.where(steep[index], b, a), numpy.rint(x0), numpy.rint(x1)))
+    ys = numpy.concatenate((numpy.where(steep[index], a, b), numpy.rint(y0), numpy.rint(y1)))
+
+    xs, ys = xs.astype(numpy.int64), ys.astype(numpy.int64)
+    inside = (xs >= left) & (xs < min(left + tile, pixels.shape[1] - 1)) & \
+        (ys >= top) & (ys < top + tile)
+    pixels[ys[inside] - top, xs[inside] + 1] = 0
+
+def deflate(job):
+    '''Compresses the rows of the band, ended with a full flush, and
+    blanks it for the next one. Returns the data, with the adler32 and
+    the length of the rows.'''
+    slot, rows, last = job
+    pixels = bands[slot]
+    raw = pixels[:rows].tobytes()
+    compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + \
+        compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    pixels[:, 1:] = 255
+    return data, zlib.adler32(raw) & 0xffffffff, len(raw)
@@ -1,6 +1,9 @@
 import cmd2
 import signal
 from logo.runtime.vm import Turtle
+from logo.runtime.viewport import Viewport
+from logo.compiler.cache import ParseCache
+from logo.runtime.log import OFF, SUMMARY, OPCODES
 
 class Repl(cmd2.Cmd):
     intro = '\033[36m    /\\       **** Welcome to LOGO repl. ****\n' +\
@@ -12,7 +15,9 @@ class Repl(cmd2.Cmd):
 
     def preloop(self):
         self.count = 1
-        self.turtle = Turtle()
+        import turtle
+        self.screen = turtle
+        self.turtle = Turtle(turtle, cache=ParseCache(), asynchronous=True)
 
     def do_load(self, line):
 
@@ -22,10 +27,82 @@ class Repl(cmd2.Cmd):
         else:
             self.turtle.load(line)
 
+    def do_stream(self, line):
+        if not line:
+            print 'Usage: stream <filename>'
+            print 'Example: stream huge.logo'
+        else:
+            self.turtle.stream(line)
+
     def do_ast(self, line):
         print self.turtle.ast
 
+    def do_cache(self, line):
+        if line == 'clear':
+            self.turtle.cache.clear()
+        print self.turtle.cache
+
+    def do_memo(self, line):
+        if line == 'clear':
+            self.turtle.memo.clear()
+        print self.turtle.memo
+
+    def do_log(self, line):
+        levels = {'off': OFF, 'summary': SUMMARY, 'opcodes': OPCODES}
+        if line not in levels:
+            print 'Usage: log off|summary|opcodes'
+        else:
+            self.turtle.log.level = levels[line]
+
+    def do_view(self, line):
+        args = line.split()
+        viewport = isinstance(self.turtle.tt, Viewport)
+        if args == ['off']:
+            if viewport:
+                self.turtle.tt.close()
+                self.turtle.tt = self.screen
+            return
+        if args == ['on']:
+            if not viewport:
+                self.screen.clear()
+                self.turtle.tt = Viewport(self.screen)
+        elif not viewport:
+            print 'Culling is off, type `view on` to draw through a viewport'
+            return
+        else:
+            try:
+                if args and args[0] == 'pan' and len(args) == 3:
+                    self.turtle.tt.pan(float(args[1]), float(args[2]))
+                elif args and args[0] == 'zoom' and len(args) == 2:
+                    self.turtle.tt.zoom(float(args[1]))
+                elif args == ['fit']:
+                    self.turtle.tt.fit()
+                elif args:
+                    raise ValueError(line)
+            except ValueError:
+                print 'Usage: view [on|off|pan <dx> <dy>|zoom <factor>|fit]'
+                return
+        print self.turtle.tt
+
+    def do_profile(self, line):
+        args = line.split(None, 2)
+        filename = None
+        if len(args) == 3 and args[0] == '-o':
+            filename, line = args[1], args[2]
+        if not line or line.startswith('-o'):
+            print 'Usage: profile [-o <file.folded>] <program>'
+            print 'Example: profile -o flower.folded FLOWER 30 100'
+            return
+        profile = self.turtle.profile(line)
+        print profile
+        if filename:
+            profile.save(filename)
+
+    def do_cancel(self, line):
+        self.turtle.cancel()
+
     def do_quit(self, line):
+        self.turtle.cancel()
         print '\033[36mBye bye. Happy turtling\033[39m'
         return True
 
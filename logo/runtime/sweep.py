@@ -0,0 +1,108 @@
+import itertools
+import multiprocessing
+
+from logo.compiler.parser import Parser, Ast, LogoRutimeError
+from logo.compiler.bytecode import Compiler, Memo
+from logo.runtime.fusion import fuse
+from logo.runtime.headless import Headless
+
+class Sweep(object):
+    '''Runs a proc for many argument vectors, from one compiled program.
+
+    The source is parsed and the proc compiled once, the arguments of
+    every variation are then the global frame the program runs from.
+    The variations share a Memo, so that the calls they have in common,
+    like HEXAGON :SIZE for FLOWERs of the same size, are drawn once.'''
+
+    def __init__(self, source, procname, optimize=1, fused=True):
+        self.source = source
+        self.procname = procname.upper()
+        self.optimize = optimize
+        self.fused = fused
+
+        self.ast = Ast()
+        Parser().parse(self.ast, source.upper())
+        proc = self.ast.getproc(self.procname)
+        if not proc:
+            raise LogoRutimeError('Proc `{}` not found, available ones are {}.'.\
+                format(self.procname, self.ast.getprocs()))
+        self.arity = len(proc.arguments)
+        self.program = Compiler(self.ast, optimize).invoke(proc)
+        self.memo = Memo()
+
+    def opcodes(self, arguments):
+        'The opcodes of the proc called with the arguments.'
+        if len(arguments) != self.arity:
+            raise LogoRutimeError('Proc `{}` takes {} arguments, given {}.'.\
+                format(self.procname, self.arity, len(arguments)))
+        opcodes = self.program.run(self.memo,
+            frame=[float(argument) for argument in arguments])
+        return fuse(opcodes) if self.fused else opcodes
+
+    def draw(self, arguments):
+        'The proc called with the arguments, drawn headless.'
+        backend = Headless()
+        for opcode in self.opcodes(arguments):
+            getattr(backend, opcode.name.lower())(*opcode.args)
+        return backend
+
+    def render(self, arguments, output=None):
+        '''Draws a variation, saved to output if given, formatted with the
+        arguments. Returns the filename, or the Headless backend.'''
+        backend = self.draw(arguments)
+        if output is None:
+            return backend
+        filename = output.format(*arguments)
+        backend.save(filename)
+        return filename
+
+    def map(self, variations, output=None, processes=1, chunksize=16):
+        '''Yields (arguments, result) for every variation, in order, as
+        soon as it is drawn. The result is the one of render, or the
+        exception raised by the variation.
+
+        With processes > 1 the variations are spread over a pool, every
+        process compiling the proc once.'''
+        if processes <= 1:
+            for arguments in variations:
+                yield arguments, self.attempt(arguments, output)
+            return
+
+        pool = multiprocessing.Pool(processes, setup, (self.source,
+            self.procname, self.optimize, self.fused))
+        try:
+            for result in pool.imap(variation,
+                    ((arguments, output) for arguments in variations), chunksize):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def attempt(self, arguments, output):
+        try:
+            return self.render(arguments, output)
+        except Exception, exc:
+            return exc
+
+    def __repr__(self):
+        return 'Sweep({}, {} arguments, {})'.format(self.procname, self.arity,
+            self.memo)
+
+def grid(*values):
+    'The argument vectors of all the combinations of values, per argument.'
+    return itertools.product(*values)
+
+sweep = None # of the worker process
+
+def setup(source, procname, optimize, fused):
+    'Initializer of the worker processes.'
+    global sweep
+    sweep = Sweep(source, procname, optimize, fused)
+
+def variation(job):
+    arguments, output = job
+    result = sweep.attempt(arguments, output)
+    if isinstance(result, Exception):
+        # not every exception can be unpickled by the parent
+        result = LogoRutimeError('{}: {}'.format(type(result).__name__, result))
+    return arguments, result
@@ -0,0 +1,227 @@
+import math
+
+from logo.runtime.headless import Headless
+
+CELL = 64.0      # side of a cell of the grid index, in turtle units
+TOLERANCE = 1e-6 # distance under which two points are the same
+TAG = 'logo'     # of the canvas items drawn
+WIDTH, HEIGHT = 800, 600 # of the window, without a screen
+
+class Grid(object):
+    '''Uniform grid index of segments. A segment is filed under the cells
+    of points sampled along it at most half a cell apart, so that every
+    segment crossing a rectangle is in the cells of the rectangle or one
+    cell around them.'''
+
+    def __init__(self, cell=CELL):
+        self.cell = cell
+        self.cells = {} # (column, row) -> ids of the segments
+        self.size = 0
+
+    def key(self, x, y):
+        return int(math.floor(x / self.cell)), int(math.floor(y / self.cell))
+
+    def insert(self, id, x0, y0, x1, y1):
+        steps = int(2 * math.hypot(x1 - x0, y1 - y0) / self.cell) + 1
+        keys = set(self.key(x0 + (x1 - x0) * step / steps,
+            y0 + (y1 - y0) * step / steps) for step in range(steps + 1))
+        for key in keys:
+            self.cells.setdefault(key, []).append(id)
+        self.size += 1
+
+    def query(self, xmin, ymin, xmax, ymax):
+        'Ids of the segments which may cross the rectangle.'
+        cmin, rmin = self.key(xmin, ymin)
+        cmax, rmax = self.key(xmax, ymax)
+        ids = set()
+        if (cmax - cmin + 3) * (rmax - rmin + 3) > len(self.cells):
+            # zoomed out, fewer cells filled than in the rectangle
+            for (column, row), cell in self.cells.iteritems():
+                if cmin - 1 <= column <= cmax + 1 and rmin - 1 <= row <= rmax + 1:
+                    ids.update(cell)
+            return ids
+        for column in range(cmin - 1, cmax + 2):
+            for row in range(rmin - 1, rmax + 2):
+                ids.update(self.cells.get((column, row), ()))
+        return ids
+
+    def __repr__(self):
+        return '\033[32mGrid\033[39m({} segments, {} cells of {})'.\
+            format(self.size, len(self.cells), self.cell)
+
+class Viewport(Headless):
+    '''Headless turtle which draws on the Tk canvas only what can be seen.
+
+    Every move drawn with the pen down is filed in a Grid. Moves over
+    lines drawn before are dropped, the others drawn only when they cross
+    the viewport, so the canvas holds a single item per visible line.
+    view, pan, zoom and fit query the Grid for what is in the new
+    viewport and redraw it, without running the program again.
+
+    The screen is the turtle module, whose canvas is drawn on and to
+    which tracer, update and ontimer go. Without one nothing is drawn,
+    visible still gives what would be.'''
+
+    def __init__(self, screen=None, cell=CELL):
+        self.screen = screen
+        self.canvas = screen.getcanvas() if screen else None
+        self.cell = cell
+        self.window = (screen.window_width(), screen.window_height()) \
+            if screen else (WIDTH, HEIGHT)
+        self.center = (0.0, 0.0)
+        self.scale = 1.0
+        self.viewport = self.rectangle()
+        if screen:
+            screen.hideturtle() # not moved anymore
+        Headless.__init__(self)
+
+    def __getattr__(self, name):
+        screen = self.__dict__.get('screen')
+        if screen is None:
+            raise AttributeError(name)
+        return getattr(screen, name)
+
+    def clear(self):
+        Headless.clear(self)
+        self.grid = Grid(self.cell)
+        self.covers = {} # line -> intervals drawn along it
+        self.culled = 0 # moves dropped, over lines drawn before
+        if self.canvas:
+            self.canvas.delete(TAG)
+
+    def goto(self, x, y):
+        start = len(self.pens)
+        Headless.goto(self, x, y)
+        self.index(start)
+
+    def path(self, *args):
+        start = len(self.pens)
+        Headless.path(self, *args)
+        self.index(start)
+
+    def index(self, start):
+        'Files the moves from start on, draws those in view.'
+        segments = self.segments
+        for id in range(start, len(self.pens)):
+            if not self.pens[id]:
+                continue
+            x0, y0, x1, y1 = segments[4 * id:4 * id + 4]
+            if self.covered(x0, y0, x1, y1):
+                self.culled += 1
+                continue
+            self.grid.insert(id, x0, y0, x1, y1)
+            if intersects(self.viewport, x0, y0, x1, y1):
+                self.line(x0, y0, x1, y1)
+
+    def covered(self, x0, y0, x1, y1):
+        '''Whether lines drawn before go all over the segment, else it is
+        added to the intervals of its line.'''
+        dx, dy = x1 - x0, y1 - y0
+        length = math.hypot(dx, dy)
+        if length < TOLERANCE:
+            return True
+        # the line by its direction, as an angle in [0, pi), and distance
+        # to the origin, both rounded so that drifts of the floats match
+        angle = math.atan2(dy, dx) % math.pi
+        key = round(angle / TOLERANCE) % round(math.pi / TOLERANCE)
+        angle = key * TOLERANCE
+        ux, uy = math.cos(angle), math.sin(angle)
+        offset = round((ux * y0 - uy * x0) / TOLERANCE)
+        start, end = sorted((ux * x0 + uy * y0, ux * x1 + uy * y1))
+
+        intervals = self.covers.setdefault((key, offset), [])
+        merged = []
+        for first, last in intervals:
+            if first - TOLERANCE <= start and end <= last + TOLERANCE:
+                return True
+            if last < start - TOLERANCE or first > end + TOLERANCE:
+                merged.append((first, last))
+            else:
+                start, end = min(start, first), max(end, last)
+        merged.append((start, end))
+        self.covers[(key, offset)] = merged
+        return False
+
+    def visible(self):
+        'Yields the (x0, y0, x1, y1) of the lines crossing the viewport.'
+        segments = self.segments
+        for id in sorted(self.grid.query(*self.viewport)):
+            line = tuple(segments[4 * id:4 * id + 4])
+            if intersects(self.viewport, *line):
+                yield line
+
+    def line(self, x0, y0, x1, y1):
+        if self.canvas:
+            self.canvas.create_line(self.transform(x0, y0) +\
+                self.transform(x1, y1), fill='black', tags=TAG)
+
+    def transform(self, x, y):
+        # the turtle canvas has its origin in the middle, y pointing down
+        cx, cy = self.center
+        return (x - cx) * self.scale, (cy - y) * self.scale
+
+    def rectangle(self):
+        width, height = self.window
+        cx, cy = self.center
+        dx, dy = width / 2.0 / self.scale, height / 2.0 / self.scale
+        return cx - dx, cy - dy, cx + dx, cy + dy
+
+    def view(self, xmin, ymin, xmax, ymax):
+        'Shows the rectangle, grown to the shape of the window.'
+        if self.screen:
+            self.window = (self.screen.window_width(),
+                self.screen.window_height())
+        width, height = self.window
+        self.center = ((xmin + xmax) / 2.0, (ymin + ymax) / 2.0)
+        self.scale = min(width / max(xmax - xmin, TOLERANCE),
+            height / max(ymax - ymin, TOLERANCE))
+        self.viewport = self.rectangle()
+        self.redraw()
+
+    def pan(self, dx, dy):
+        'Moves the viewport by dx, dy turtle units.'
+        xmin, ymin, xmax, ymax = self.viewport
+        self.view(xmin + dx, ymin + dy, xmax + dx, ymax + dy)
+
+    def zoom(self, factor):
+        'Magnifies by the factor, around the middle of the viewport.'
+        cx, cy = self.center
+        xmin, ymin, xmax, ymax = self.viewport
+        dx, dy = (xmax - xmin) / 2.0 / factor, (ymax - ymin) / 2.0 / factor
+        self.view(cx - dx, cy - dy, cx + dx, cy + dy)
+
+    def fit(self, margin=10):
+        'Shows the whole drawing.'
+        xmin, ymin, xmax, ymax = self.bounds()
+        self.view(xmin - margin, ymin - margin, xmax + margin, ymax + margin)
+
+    def close(self):
+        'Takes its lines off the canvas, and shows the turtle again.'
+        if self.canvas:
+            self.canvas.delete(TAG)
+        if self.screen:
+            self.screen.showturtle()
+
+    def redraw(self):
+        if self.canvas:
+            self.canvas.delete(TAG)
+            for line in self.visible():
+                self.line(*line)
+
+    def __repr__(self):
+        return '\033[32mViewport\033[39m(({:.1f}, {:.1f}, {:.1f}, {:.1f}), '\
+            'scale {:.3f}, {} moves, {} culled, {})'.format(
+            *(self.viewport + (self.scale, len(self.pens), self.culled,
+            self.grid)))
+
+def intersects(rectangle, x0, y0, x1, y1):
+    'Whether the segment crosses the rectangle.'
+    xmin, ymin, xmax, ymax = rectangle
+    if max(x0, x1) < xmin or min(x0, x1) > xmax or \
+            max(y0, y1) < ymin or min(y0, y1) > ymax:
+        return False
+    # the line crosses it unless the corners are all on one side
+    dx, dy = x1 - x0, y1 - y0
+    sides = [dx * (y - y0) - dy * (x - x0) for x, y in
+        ((xmin, ymin), (xmin, ymax), (xmax, ymin), (xmax, ymax))]
+    return min(sides) <= 0 <= max(sides)
@@ -1,37 +1,154 @@
-import turtle as tt
-from logo.compiler.parser import Parser, Ast
-from logo.compiler.codegen import Context
+import threading
+
+from logo.compiler.parser import Ast
+from logo.compiler.incremental import Loader, pieces, CHUNK
+from logo.compiler.codegen import Context, MAXDEPTH
+from logo.compiler.bytecode import Memo, INLINE
+from logo.runtime.fusion import fuse
+from logo.runtime.pipeline import Pipeline
+from logo.runtime.log import Log
+from logo.runtime.profiler import Profile
 
 class Turtle(object):
     'Virtual Machine for the Runtime of LOGO lang.'
-    def __init__(self):
-        self.tt = tt
-        self.parser = Parser()
-        self.context = Context()
+    def __init__(self, backend=None, compiled=True, optimize=1, fused=False,
+            cache=None, inline=INLINE, maxdepth=MAXDEPTH, asynchronous=False,
+            log=None):
+        if backend is None:
+            # imported lazily, Tk is not available on headless machines
+            import turtle as backend
+        self.tt = backend
+        self.context = Context(maxdepth)
         self.ast = Ast()
         self.speed = 3
+        self.compiled = compiled
+        self.optimize = optimize
+        self.fused = fused
+        self.inline = inline # max size of the procs inlined at optimize=2
+        self.maxdepth = maxdepth # max number of nested proc calls
+        self.cache = cache
+        self.loader = Loader(self.ast, cache)
+        self.memo = Memo() # expansions of deterministic procs
+        self.log = log if log else Log()
+        # opcodes generated on a thread of their own, drawn in batches
+        self.pipeline = Pipeline(self) if asynchronous else None
+        # held while the Ast is updated and compiled, a file streamed on
+        # the thread of the pipeline updates it between commands
+        self.lock = threading.RLock()
 
-    def eval(self, line):
-        self.parser = Parser()
-        self.drain()
-        self.parser.parse(self.ast, line.upper()) # case insensitive
-        for opcode in self.ast.gencode(self.context):
-            print 'executing ...', opcode
-            self.execute(opcode)
+    def eval(self, line, optimize=None):
+        with self.lock:
+            self.drain()
+            self.update(line.upper()) # case insensitive
+            opcodes = self.generate(optimize)
+        self.draw(opcodes)
 
-    def load(self, filename):
+    def load(self, filename, optimize=None):
         source = open(filename, 'r').read()
-        self.parser = Parser()
-        self.parser.parse(self.ast, source.upper())
-        for opcode in self.ast.gencode(self.context):
-            print 'executing ...', opcode
-            self.execute(opcode)
+        with self.lock:
+            self.drain()
+            self.update(source.upper(), filename)
+            opcodes = self.generate(optimize)
+        self.draw(opcodes)
+
+    def stream(self, filename, optimize=None):
+        '''Runs the file as it is read, see streamed. With a pipeline, it
+        is read no faster than it is drawn.'''
+        with self.lock:
+            self.drain()
+        self.draw(self.streamed(filename, optimize))
+
+    def streamed(self, filename, optimize=None):
+        '''Yields the opcodes of the file, every global or TO block run as
+        soon as it is read, then forgotten, so that memory is bounded by
+        the longest of them rather than by the file. Every piece is
+        parsed and compiled under the lock, its globals are then marked
+        as run, so that commands evaluated meanwhile don't drain them.'''
+        with open(filename, 'r') as source:
+            chunks = iter(lambda: source.read(CHUNK), '')
+            for text, line in pieces(chunk.upper() for chunk in chunks):
+                with self.lock:
+                    self.update(text, line=line, cached=False)
+                    opcodes = self.generate(optimize)
+                for opcode in opcodes:
+                    yield opcode
+                with self.lock:
+                    self.ast.prune()
+
+    def draw(self, opcodes):
+        if self.pipeline:
+            self.pipeline.submit(opcodes)
+            return
+        try:
+            for opcode in opcodes:
+                self.execute(opcode)
+        finally:
+            self.log.end()
+
+    def wait(self):
+        'Returns once the programs submitted are drawn.'
+        if self.pipeline:
+            self.pipeline.wait()
+
+    def cancel(self):
+        'Stops drawing the programs submitted.'
+        if self.pipeline:
+            self.pipeline.cancel()
+
+    def update(self, source, filename=None, line=1, cached=True):
+        'Parses what changed in the source, forgets what depended on it.'
+        try:
+            changed = self.loader.load(source, filename, line, cached)
+        except Exception:
+            self.memo.clear() # some of the source may have been loaded
+            raise
+        self.memo.invalidate(changed)
+        return changed
 
     def drain(self):
-        for opcode in self.ast.gencode(self.context):
-            print 'draining ...', opcode
+        'Skips the globals left over by a run which failed.'
+        for glob in self.ast.globals:
+            glob.done = True
+
+    def profile(self, line, optimize=None):
+        '''Draws the line, returns the Profile of the run. Drawing is not
+        pipelined, so that its time goes to the lines emitting.'''
+        self.wait()
+        profile = Profile()
+        with self.lock:
+            self.drain()
+            self.update(line.upper())
+            opcodes = self.generate(optimize, profile)
+        try:
+            for opcode in opcodes:
+                self.execute(opcode)
+        finally:
+            self.log.end()
+        return profile
+
+    def generate(self, optimize=None, profile=None):
+        '''The opcodes of the globals, profiled if asked. Profiles run
+        without the memo, inlining nor tail calls, which would take the
+        frames of the procs called off the stacks.'''
+        if optimize is None:
+            optimize = self.optimize
+        if profile is not None:
+            opcodes = self.ast.compile(min(optimize, 1), self.inline,
+                tailcalls=False).run(None, self.maxdepth, profile=profile)
+        elif self.compiled:
+            opcodes = self.ast.compile(optimize, self.inline).run(
+                self.memo, self.maxdepth)
+        else:
+            opcodes = self.ast.gencode(self.context)
+        if self.fused:
+            opcodes = fuse(opcodes)
+        return opcodes
 
     def execute(self, opcode):
+        self.log.record(opcode)
+        if opcode.name == 'PATH' and not hasattr(self.tt, 'path'):
+            self.path(*opcode.args)
+            return
         # real comment: very clever metaprogramming!!
         getattr(self.tt, opcode.name.lower())(*opcode.args)
         if opcode.name == 'SPEED':
@@ -39,9 +156,28 @@ class Turtle(object):
         elif opcode.name == 'RESET':
             self.tt.speed(self.speed)
 
+    def path(self, *args):
+        'Draws a fused PATH with Tk, with a single redraw at the end.'
+        tracer = self.tt.tracer()
+        self.tt.tracer(0)
+        for index in range(0, len(args), 2):
+            if args[index]:
+                self.tt.rt(args[index])
+            self.tt.fd(args[index + 1])
+        self.tt.tracer(tracer)
+
 if __name__ == '__main__':
+    import sys
+    from logo.runtime.headless import Headless
 
     filename = 'samples/polygon.logo'
-    turtle = Turtle()
-    turtle.load(filename)
+    if len(sys.argv) > 1:
+        # headless run, e.g. `python -m logo.runtime.vm flower.svg FLOWER 30 100`
+        turtle = Turtle(Headless(), fused=True)
+        turtle.load(filename)
+        turtle.eval(' '.join(sys.argv[2:]))
+        turtle.tt.save(sys.argv[1])
+    else:
+        turtle = Turtle()
+        turtle.load(filename)
 